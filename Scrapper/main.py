@@ -1,17 +1,12 @@
 import re
 import requests
-import uuid
-import json
 from bs4 import BeautifulSoup
 from datetime import datetime
-import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
 import time
 import random
-
-TOKEN = ''
-
-with open('token.txt', 'r') as file:
-    TOKEN = file.read().strip()
+from store import MetricsStore, STORE_FILE
 
 API_URLS = {
     'exercise': 'https://intra.forge.epita.fr/epita-ing-assistants-acu/piscine-2026/root/exercises/exercises-c/{EXERCISE_NAME}/{EXERCISE_NAME}',
@@ -19,96 +14,151 @@ API_URLS = {
     'metrics': 'https://srvc-stats.api.forge.epita.fr/metrics/execution/{TAG_UUID}',
 }
 
-EXERCISES_LIST = []
-
-with open('exercises.txt', 'r') as file:
-    content = file.read()
-    EXERCISES_LIST = content.splitlines()
-
-print(EXERCISES_LIST)
-
-EXTRACTED_DATA = {}
-data_lock = threading.Lock()
-
-def tag_thread(exercise, id, counter=0):
-    metrics_url = API_URLS['metrics'].format(TAG_UUID=id)
-    print(metrics_url)
-    metrics_response = requests.get(metrics_url)
-    metrics_code = metrics_response.status_code
-
-    print(metrics_code)
-
-    if metrics_code != 200:
-        if counter == 100:
-            return
-        time.sleep(random.randint(10, 40))
-        tag_thread(exercise, id, counter + 1)
-        return
-
-    with data_lock:
-        data = metrics_response.json()
-        for key, value in data.items():
-            EXTRACTED_DATA[exercise]['tags'][id][key] = value
-
-THREADS = []
-
-for i, exercise in enumerate(EXERCISES_LIST):
-    time.sleep(1)
-    
-    print(f'Processing exercise {i+1}/{len(EXERCISES_LIST)}: {exercise}')
-    url = API_URLS['exercise'].format(EXERCISE_NAME=exercise)
-    headers = {
-        'Cookie': 'role=MANAGER;' + TOKEN
-    }
-    response = requests.get(url, headers=headers)
-    code = response.status_code
-
-    if code != 200:
-        print(f'Token has expired, redo the whole process!')
-        continue
-
-    text = response.text
+# requests in flight at the same time, also the size of the keep-alive connection pool
+MAX_WORKERS = 16
+# attempts per request, the delay before attempt n is drawn in [0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** n)]
+MAX_ATTEMPTS = 100
+EXERCISE_MAX_ATTEMPTS = 3
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 40.0
+
+UUID_REGEX = re.compile(
+    r".*[0-9a-fA-F]{8}-"
+    r"[0-9a-fA-F]{4}-"
+    r"[0-9a-fA-F]{4}-"
+    r"[0-9a-fA-F]{4}-"
+    r"[0-9a-fA-F]{12}$"
+)
+
+def make_session(pool_size=MAX_WORKERS):
+    # one session shared by every worker: connections are kept alive and reused instead of one socket per request.
+    # It holds no credentials, the intranet cookie is only added to the exercise page requests
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    # exponential backoff with full jitter, so that failed requests do not all come back at once
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+def fetch(session, url, parse, headers=None, max_attempts=MAX_ATTEMPTS, base=BACKOFF_BASE, cap=BACKOFF_MAX, timeout=30):
+    """
+    GET url until it answers 200 with a body parse() accepts or max_attempts is spent, sleeping
+    backoff_delay() between attempts. A ValueError from parse (an HTML page instead of JSON...)
+    counts as a failed attempt. Returns parse(response), None if every attempt failed.
+    """
+    for attempt in range(max_attempts):
+        if attempt > 0:
+            time.sleep(backoff_delay(attempt - 1, base, cap))
+        try:
+            response = session.get(url, headers=headers, timeout=timeout)
+        except requests.RequestException as e:
+            print(f'{url}: {e}')
+            continue
+        if response.status_code != 200:
+            print(f'{url}: {response.status_code}')
+            continue
+        try:
+            return parse(response)
+        except ValueError as e:
+            print(f'{url}: unexpected body ({e})')
+    return None
+
+def parse_exercise_page(text):
+    # {tag uuid: {'submission_date': datetime or None}} of the tags listed on an exercise page
     soup = BeautifulSoup(text, 'html.parser')
+    tags = {}
 
-    uuid_regex = re.compile(
-        r".*[0-9a-fA-F]{8}-"
-        r"[0-9a-fA-F]{4}-"
-        r"[0-9a-fA-F]{4}-"
-        r"[0-9a-fA-F]{4}-"
-        r"[0-9a-fA-F]{12}$"
-    )
-
-    EXTRACTED_DATA[exercise] = { 'tags': {} }
-
-    elements = soup.find_all(href=uuid_regex)
-
-    TAGS_IDS = []
-
-    for el in elements:
-        href = el["href"]
-        uuid = href.split("/")[-1]
+    for el in soup.find_all(href=UUID_REGEX):
+        tag_id = el["href"].split("/")[-1]
 
         sub = el.select_one(".list__item__subname")
         if sub:
-            text = sub.get_text(strip=True)
-            raw_date = text.replace("Submitted on ", "")
+            raw_date = sub.get_text(strip=True).replace("Submitted on ", "")
             dt = datetime.strptime(raw_date, "%B %d, %Y - %H:%M")
         else:
             dt = None
 
-        TAGS_IDS.append(uuid)
-        EXTRACTED_DATA[exercise]['tags'][uuid] = { 'submission_date': dt }
+        tags[tag_id] = { 'submission_date': dt }
+    return tags
 
-    for id in TAGS_IDS:
-        thread = threading.Thread(target=tag_thread, args=(exercise, id))
-        thread.start()
-        THREADS.append(thread)
-
-    print(f'Finished processing exercise {exercise}')
-
-
-for thread in THREADS:
-    thread.join()
-
-with open('result.json', 'w') as outfile:
-    json.dump(EXTRACTED_DATA, outfile, default=str, indent=4)
\ No newline at end of file
+def fetch_exercise(session, exercise, token, urls=API_URLS, **retry):
+    headers = {
+        'Cookie': 'role=MANAGER;' + token
+    }
+    url = urls['exercise'].format(EXERCISE_NAME=exercise)
+    tags = fetch(session, url, lambda response: parse_exercise_page(response.text), headers, **{'max_attempts': EXERCISE_MAX_ATTEMPTS, **retry})
+    if tags is None:
+        print(f'Could not fetch {exercise}, the token may have expired, redo the whole process!')
+    return tags
+
+def fetch_metrics(session, tag_id, urls=API_URLS, **retry):
+    return fetch(session, urls['metrics'].format(TAG_UUID=tag_id), lambda response: response.json(), **retry)
+
+def crawl(exercises, token, store, urls=API_URLS, max_workers=MAX_WORKERS, **retry):
+    """
+    Fetches every exercise page, then the metrics of every tag listed on them that store does not
+    have yet, at most max_workers requests at a time over one pooled session. Tag requests are
+    queued as soon as their exercise page is parsed, so pages and metrics are fetched concurrently,
+    and metrics go to store as they arrive instead of staying in memory.
+    retry is passed to fetch() (max_attempts, base, cap, timeout). Returns the number of tags fetched.
+    """
+    session = make_session(max_workers)
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    fetched = 0
+    metrics = {}
+
+    try:
+        pages = {pool.submit(fetch_exercise, session, exercise, token, urls, **retry): exercise for exercise in exercises}
+
+        for i, future in enumerate(as_completed(pages)):
+            exercise = pages[future]
+            tags = future.result()
+            if tags is None:
+                continue
+
+            store.add_tags(exercise, tags)
+            missing = store.missing(exercise)
+            print(f'Processed exercise {i+1}/{len(exercises)}: {exercise} ({len(missing)}/{len(tags)} tags to fetch)')
+            for tag_id in missing:
+                metrics[pool.submit(fetch_metrics, session, tag_id, urls, **retry)] = tag_id
+
+        for future in as_completed(metrics):
+            tag_id = metrics.pop(future)
+            data = future.result()
+            if data is not None:
+                store.set_metrics(tag_id, data)
+                fetched += 1
+    except BaseException:
+        # queued requests are dropped, the ones already answered are kept for the next run
+        pool.shutdown(cancel_futures=True)
+        for future, tag_id in metrics.items():
+            if future.done() and not future.cancelled() and future.exception() is None and future.result() is not None:
+                store.set_metrics(tag_id, future.result())
+        store.flush()
+        session.close()
+        raise
+
+    pool.shutdown()
+    store.flush()
+    session.close()
+    return fetched
+
+if __name__ == "__main__":
+    with open('token.txt', 'r') as file:
+        TOKEN = file.read().strip()
+
+    with open('exercises.txt', 'r') as file:
+        EXERCISES_LIST = file.read().splitlines()
+
+    print(EXERCISES_LIST)
+
+    # tags already fetched by a previous (interrupted) run are kept in the store and not fetched again
+    STORE = MetricsStore(STORE_FILE)
+    try:
+        print(f'Fetched {crawl(EXERCISES_LIST, TOKEN, STORE)} tags')
+    finally:
+        STORE.export(EXERCISES_LIST, 'result.json')
+        STORE.close()
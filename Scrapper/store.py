@@ -0,0 +1,83 @@
+import json
+import sqlite3
+import textwrap
+
+STORE_FILE = 'metrics.db'
+# metrics written before a commit, what is lost at most if the process dies
+FLUSH_EVERY = 200
+
+class MetricsStore:
+    """
+    On-disk store of the scrape, one row per tag UUID: its exercise, submission date and metrics
+    (NULL until fetched), plus every exercise whose page was fetched, even without tags. Reruns
+    only fetch the tags whose metrics are still missing, and nothing but the store has to be kept
+    between runs. Only meant to be used from one thread.
+    """
+
+    def __init__(self, path=STORE_FILE, flush_every=FLUSH_EVERY):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS tags ('
+            'tag_id TEXT PRIMARY KEY, exercise TEXT NOT NULL, submission_date TEXT, metrics TEXT)'
+        )
+        self.connection.execute('CREATE TABLE IF NOT EXISTS exercises (exercise TEXT PRIMARY KEY)')
+        # stores written before the exercises table existed
+        self.connection.execute('INSERT OR IGNORE INTO exercises SELECT DISTINCT exercise FROM tags')
+        self.connection.commit()
+        self.flush_every = flush_every
+        self.unflushed = 0
+
+    def add_tags(self, exercise, tags):
+        # tags as parse_exercise_page returns them, metrics already fetched are kept
+        self.connection.execute('INSERT OR IGNORE INTO exercises (exercise) VALUES (?)', (exercise,))
+        self.connection.executemany(
+            'INSERT INTO tags (tag_id, exercise, submission_date) VALUES (?, ?, ?) '
+            'ON CONFLICT(tag_id) DO UPDATE SET exercise = excluded.exercise, submission_date = excluded.submission_date',
+            [(tag_id, exercise, None if tag['submission_date'] is None else str(tag['submission_date'])) for tag_id, tag in tags.items()]
+        )
+        self.connection.commit()
+
+    def missing(self, exercise):
+        # tags of exercise without metrics yet
+        rows = self.connection.execute('SELECT tag_id FROM tags WHERE exercise = ? AND metrics IS NULL ORDER BY rowid', (exercise,))
+        return [tag_id for tag_id, in rows]
+
+    def set_metrics(self, tag_id, metrics):
+        self.connection.execute('UPDATE tags SET metrics = ? WHERE tag_id = ?', (json.dumps(metrics), tag_id))
+        self.unflushed += 1
+        if self.unflushed >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        self.connection.commit()
+        self.unflushed = 0
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+    def has_exercise(self, exercise):
+        return self.connection.execute('SELECT 1 FROM exercises WHERE exercise = ?', (exercise,)).fetchone() is not None
+
+    def exercise_tags(self, exercise):
+        # {tag uuid: {'submission_date': ..., **metrics}}, the layout of result.json
+        rows = self.connection.execute('SELECT tag_id, submission_date, metrics FROM tags WHERE exercise = ? ORDER BY rowid', (exercise,))
+        return {tag_id: {'submission_date': date, **(json.loads(metrics) if metrics else {})} for tag_id, date, metrics in rows}
+
+    def export(self, exercises, path):
+        """
+        Writes the store as result.json (same layout as a json.dump(..., indent=4) of the whole scrape),
+        one exercise at a time so that memory does not grow with the number of exercises.
+        """
+        with open(path, 'w') as outfile:
+            outfile.write('{')
+            first = True
+            for exercise in exercises:
+                # exercises never fetched are left out, like in the scrape itself
+                if not self.has_exercise(exercise):
+                    continue
+                tags = self.exercise_tags(exercise)
+                content = textwrap.indent(json.dumps({ 'tags': tags }, default=str, indent=4), '    ').lstrip()
+                outfile.write(('\n' if first else ',\n') + f'    {json.dumps(exercise)}: {content}')
+                first = False
+            outfile.write('\n}' if not first else '}')
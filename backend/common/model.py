@@ -1,9 +1,12 @@
+import json
+import os
 import pydantic
-from datetime import datetime
+import numpy as np
+from datetime import date, datetime
 from uuid import UUID
 from enum import Enum
-from typing import Union, Optional, Tuple, List
-from pydantic import BaseModel
+from typing import Any, Union, Optional, Tuple, List, Callable, Iterable, Iterator
+from pydantic import BaseModel, ConfigDict
 from datetime import timedelta
 
 class PopulationType(str, Enum):
@@ -22,6 +25,13 @@ class ArchitectureType(str, Enum):
     def __str__(self):
         return self.value
 
+class RandomStream(str, Enum):
+    BATCH = 'BATCH'
+    TAG = 'TAG'
+
+    def __str__(self):
+        return self.value
+
 class Tag(pydantic.BaseModel):
     id: UUID
     time : datetime
@@ -33,6 +43,204 @@ class Tag(pydantic.BaseModel):
     def __str__(self):
         return f"Tag(id={self.id}, time={self.time}, population={self.population}, exercise_name={self.exercise_name})"
 
+POPULATIONS = list(PopulationType)
+POPULATION_CODES = {population: code for code, population in enumerate(POPULATIONS)}
+
+class TagBatch:
+    """
+    Struct-of-arrays storage for tags: one numpy array per field instead of one pydantic object per tag.
+
+    times are int64 nanoseconds since epoch (naive, like Tag.time), population holds codes into POPULATIONS,
+    exercise and user hold codes into exercise_names and user_ids, ids holds the raw 16 bytes of each tag UUID.
+    """
+
+    __slots__ = ("ids", "times", "population", "strength", "exercise", "user", "exercise_names", "user_ids", "is_sorted")
+
+    def __init__(self, ids, times, population, strength, exercise, user, exercise_names, user_ids, is_sorted=False):
+        self.ids = np.asarray(ids, dtype="V16")
+        self.times = np.asarray(times, dtype=np.int64)
+        self.population = np.asarray(population, dtype=np.int8)
+        self.strength = np.asarray(strength, dtype=np.int8)
+        self.exercise = np.asarray(exercise, dtype=np.int32)
+        self.user = np.asarray(user, dtype=np.int64)
+        self.exercise_names = exercise_names if isinstance(exercise_names, list) else list(exercise_names)
+        self.user_ids = user_ids if isinstance(user_ids, list) else list(user_ids)
+        self.is_sorted = is_sorted
+
+    def __len__(self):
+        return len(self.times)
+
+    def __repr__(self):
+        return f"TagBatch(size={len(self)}, exercises={len(self.exercise_names)}, users={len(self.user_ids)})"
+
+    @classmethod
+    def empty(cls) -> "TagBatch":
+        return cls([], [], [], [], [], [], [], [], is_sorted=True)
+
+    @classmethod
+    def from_tags(cls, tags: list[Tag]) -> "TagBatch":
+        exercise_codes = {}
+        user_codes = {}
+
+        ids = np.frombuffer(b"".join(tag.id.bytes for tag in tags), dtype="V16")
+        times = np.array([tag.time for tag in tags], dtype="datetime64[ns]").astype(np.int64)
+        population = np.fromiter((POPULATION_CODES[tag.population] for tag in tags), dtype=np.int8, count=len(tags))
+        strength = np.fromiter((tag.is_strong for tag in tags), dtype=np.int8, count=len(tags))
+        exercise = np.fromiter((exercise_codes.setdefault(tag.exercise_name, len(exercise_codes)) for tag in tags), dtype=np.int32, count=len(tags))
+        user = np.fromiter((user_codes.setdefault(tag.user_id, len(user_codes)) for tag in tags), dtype=np.int64, count=len(tags))
+
+        return cls(ids, times, population, strength, exercise, user, exercise_codes.keys(), user_codes.keys()).sort()
+
+    @classmethod
+    def concat(cls, batches: list["TagBatch"]) -> "TagBatch":
+        batches = [batch for batch in batches if len(batch) > 0]
+        if not batches:
+            return cls.empty()
+
+        # batches cut from the same generator share their code tables, nothing to remap then
+        shared_exercises = all(batch.exercise_names is batches[0].exercise_names for batch in batches)
+        shared_users = all(batch.user_ids is batches[0].user_ids for batch in batches)
+
+        exercise_names = batches[0].exercise_names if shared_exercises else list(dict.fromkeys(name for batch in batches for name in batch.exercise_names))
+        user_ids = batches[0].user_ids if shared_users else list(dict.fromkeys(user_id for batch in batches for user_id in batch.user_ids))
+        exercise_codes = {name: code for code, name in enumerate(exercise_names)}
+        user_codes = {} if shared_users else {user_id: code for code, user_id in enumerate(user_ids)}
+
+        exercise = []
+        user = []
+        for batch in batches:
+            if shared_exercises:
+                exercise.append(batch.exercise)
+            else:
+                exercise_map = np.array([exercise_codes[name] for name in batch.exercise_names], dtype=np.int32)
+                exercise.append(exercise_map[batch.exercise])
+            if shared_users:
+                user.append(batch.user)
+            else:
+                user_map = np.array([user_codes[user_id] for user_id in batch.user_ids], dtype=np.int64)
+                user.append(user_map[batch.user])
+
+        return cls(
+            np.concatenate([batch.ids for batch in batches]),
+            np.concatenate([batch.times for batch in batches]),
+            np.concatenate([batch.population for batch in batches]),
+            np.concatenate([batch.strength for batch in batches]),
+            np.concatenate(exercise),
+            np.concatenate(user),
+            exercise_names,
+            user_ids,
+        )
+
+    def take(self, indices) -> "TagBatch":
+        return TagBatch(
+            self.ids[indices], self.times[indices], self.population[indices], self.strength[indices],
+            self.exercise[indices], self.user[indices], self.exercise_names, self.user_ids
+        )
+
+    def sort(self) -> "TagBatch":
+        if self.is_sorted:
+            return self
+        batch = self.take(np.argsort(self.times, kind="stable"))
+        batch.is_sorted = True
+        return batch
+
+    def datetimes(self) -> np.ndarray:
+        return self.times.astype("datetime64[ns]")
+
+    def datetime_list(self) -> list[datetime]:
+        return self.datetimes().astype("datetime64[us]").tolist()
+
+    def tag_ids(self, indices=None) -> list[UUID]:
+        ids = self.ids if indices is None else self.ids[indices]
+        return [UUID(bytes=raw.tobytes()) for raw in ids]
+
+    ARRAYS = ("ids", "times", "population", "strength", "exercise", "user")
+
+    def save(self, path: str):
+        # one .npy per column so that load() can memory-map them instead of reading everything
+        os.makedirs(path, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(os.path.join(path, name + ".npy"), getattr(self, name))
+        np.save(os.path.join(path, "user_ids.npy"), np.frombuffer(b"".join(user_id.bytes for user_id in self.user_ids), dtype="V16"))
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({"exercise_names": self.exercise_names, "is_sorted": self.is_sorted}, f)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "TagBatch":
+        mmap_mode = "r" if mmap else None
+        arrays = [np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode) for name in cls.ARRAYS]
+        user_ids = [UUID(bytes=raw.tobytes()) for raw in np.load(os.path.join(path, "user_ids.npy"))]
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        return cls(*arrays, meta["exercise_names"], user_ids, is_sorted=meta["is_sorted"])
+
+    def to_tags(self) -> list[Tag]:
+        times = self.datetime_list()
+        return [
+            Tag(
+                id=tag_id,
+                time=times[i],
+                population=POPULATIONS[self.population[i]],
+                exercise_name=self.exercise_names[self.exercise[i]],
+                user_id=self.user_ids[self.user[i]],
+                is_strong=bool(self.strength[i])
+            )
+            for i, tag_id in enumerate(self.tag_ids())
+        ]
+
+
+class TagStream:
+    """
+    Tags produced chunk by chunk: every chunk is a sorted TagBatch and chunks come in time order,
+    so the kernel can simulate them as they arrive without holding the whole workload.
+    Built from a factory so that the stream can be iterated again (one pass per replication).
+    """
+
+    def __init__(self, factory: Callable[[], Iterable[TagBatch]]):
+        self.factory = factory
+
+    def __iter__(self) -> Iterator[TagBatch]:
+        last = None
+        for chunk in self.factory():
+            if len(chunk) == 0:
+                continue
+            chunk = chunk.sort()
+            if last is not None and chunk.times[0] < last:
+                raise ValueError("TagStream chunks must come in time order.")
+            last = chunk.times[-1]
+            yield chunk
+
+    def to_batch(self) -> TagBatch:
+        batch = TagBatch.concat(list(self))
+        batch.is_sorted = True
+        return batch
+
+class TagSource(BaseModel):
+    """
+    Reference to a workload instead of the workload itself, a few hundred bytes to pickle or to
+    persist next to results. Resolved only when an engine needs the tags, in this order:
+    archive (a TagBatch.save folder, memory-mapped), cache_key (an entry of the pushes cache)
+    or generation overrides (through the pushes cache, or as a TagStream with stream).
+    """
+    archive: Optional[str] = None
+    cache_key: Optional[str] = None
+    # same default as pushs.generation.CACHE_DIR
+    cache_dir: str = "pushes_cache"
+    generation: Optional[dict[str, Any]] = None
+    stream: bool = False
+
+    def resolve(self) -> Union[TagBatch, TagStream]:
+        if self.archive is not None:
+            return TagBatch.load(self.archive)
+        # imported here, pushs itself depends on this module
+        from pushs.generation import generate_pushes_cached, generate_pushes_stream, load_cache_entry
+        if self.cache_key is not None:
+            return load_cache_entry(os.path.join(self.cache_dir, self.cache_key))
+
+        if self.stream:
+            return generate_pushes_stream(self.generation)
+        # no plots here, resolving tags should not write into results/
+        return generate_pushes_cached(overrides=self.generation, cache_dir=self.cache_dir, plot=False)
 
 class ExerciseRegistry(BaseModel):
     exercises: dict[str, Tuple[int, int]]
@@ -41,14 +249,61 @@ class PopulationCalendarPriority(BaseModel):
     population: PopulationType
     priority_schedules: List[Tuple[Tuple[Tuple[int, int, int], Tuple[int, int, int]], float]]
 
+class CalendarPriorityException(BaseModel):
+    # one-off override (holiday, exam day...) of a population priority on a given date, whole day by default
+    day: date
+    population: PopulationType
+    priority: float
+    start: Tuple[int, int] = (0, 0)
+    end: Tuple[int, int] = (24, 0)
+
 class CalendarPriorityConfig(BaseModel):
     priorities : dict[PopulationType, list[PopulationCalendarPriority]]
+    exceptions: list[CalendarPriorityException] = []
 
 class Input(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
     num_servers : int = 1
     architecture: ArchitectureType
-    tags: list[Tag]
+    tags: Union[list[Tag], TagBatch, TagStream, TagSource]
     registry: ExerciseRegistry
     population_queue_sizes : Optional[dict[PopulationType, int]] = None
     time_limit: Optional[timedelta] = timedelta(seconds=5)
     calendar_priority_config: Optional[CalendarPriorityConfig] = None
+    # anti-priority history: last N accepted tags and/or tags accepted during the last history_window
+    history_length: Optional[int] = 100
+    history_window: Optional[timedelta] = None
+    # seeds the service and exit time draws, None draws a fresh run every time
+    seed: Optional[int] = None
+    # TAG keys each tag's draws to its id so that every architecture sees the same service times
+    random_stream: RandomStream = RandomStream.BATCH
+    antithetic: bool = False
+
+    @classmethod
+    def trusted(cls, tags: Union[list[Tag], TagBatch, TagStream, TagSource], **fields) -> "Input":
+        """
+        Input around tags that are already validated (generators, TagBatch.load...): the scenario
+        fields go through validation as usual, tags is referenced as is, without a per-tag check or a copy.
+        """
+        return cls(tags=TagBatch.empty(), **fields).model_copy(update={"tags": tags})
+
+    def resolve_tags(self) -> Union[list[Tag], TagBatch, TagStream]:
+        return self.tags.resolve() if isinstance(self.tags, TagSource) else self.tags
+
+    def tag_batch(self) -> TagBatch:
+        return _as_tag_batch(self.resolve_tags())
+
+    def tag_chunks(self) -> Iterable[TagBatch]:
+        # what the kernel consumes: the stream itself, or the whole workload as a single chunk
+        tags = self.resolve_tags()
+        if isinstance(tags, TagStream):
+            return tags
+        return [_as_tag_batch(tags)]
+
+def _as_tag_batch(tags: Union[list[Tag], TagBatch, TagStream]) -> TagBatch:
+    if isinstance(tags, TagBatch):
+        return tags.sort()
+    if isinstance(tags, TagStream):
+        return tags.to_batch()
+    return TagBatch.from_tags(tags)
@@ -1,8 +1,9 @@
 import logging
 import warnings
 import os
-import random
+import numpy as np
 from datetime import timedelta
+from common.model import TagBatch, ExerciseRegistry, RandomStream
 
 logging.basicConfig(
     level=logging.INFO,
@@ -17,8 +18,83 @@ warnings.filterwarnings(
 EXIT_QUEUE_PROCESS_TIME_MIN = int(os.getenv("EXIT_QUEUE_PROCESS_TIME_MIN", "30"))
 EXIT_QUEUE_PROCESS_TIME_MAX = int(os.getenv("EXIT_QUEUE_PROCESS_TIME_MAX", "50"))
 
-def random_exit_queue_process_delta() -> int:
-    return timedelta(milliseconds=random.randint(EXIT_QUEUE_PROCESS_TIME_MIN, EXIT_QUEUE_PROCESS_TIME_MAX))
+NS_PER_MS = 1_000_000
+NS_PER_SECOND = 1_000 * NS_PER_MS
+NS_PER_MINUTE = 60 * NS_PER_SECOND
+NS_PER_HOUR = 60 * NS_PER_MINUTE
 
-def random_server_setup_delta():
-    return timedelta(seconds=random.randint(20, 30))
+# engines keep every instant as int64 nanoseconds since epoch, this plays the role of datetime.min
+TIME_MIN_NS = -(2 ** 63)
+
+def to_ns(delta: timedelta) -> int:
+    return (delta // timedelta(microseconds=1)) * 1_000
+
+SERVER_SETUP_TIME_MIN = 20
+SERVER_SETUP_TIME_MAX = 30
+
+SPLITMIX_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+
+def _splitmix64(x: np.ndarray) -> np.ndarray:
+    # uint64 arithmetic wraps around, which is exactly what the mixer expects
+    z = x + SPLITMIX_GAMMA
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+def tag_uniforms(batch: TagBatch, seed: int, stream: int) -> np.ndarray:
+    """
+    Uniforms in [0, 1) that only depend on (seed, stream, tag id): a tag gets the same draw
+    whatever the architecture, the processing order or the other tags of the batch.
+    """
+    halves = batch.ids.view(np.uint64).reshape(-1, 2)
+    key = _splitmix64(np.array([seed % 2 ** 64], dtype=np.uint64) ^ _splitmix64(np.array([stream], dtype=np.uint64)))
+    x = _splitmix64(_splitmix64(halves[:, 0] ^ key) ^ halves[:, 1])
+    return (x >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+
+def uuid4_array(n: int, rng: np.random.Generator | None = None) -> np.ndarray:
+    # n random version 4 UUIDs as raw V16 values (TagBatch.ids layout), without one uuid4() call each
+    rng = rng if rng is not None else np.random.default_rng()
+    raw = rng.integers(0, 256, size=(n, 16), dtype=np.uint8)
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+    return raw.view("V16").ravel()
+
+def _uniform_integers(u: np.ndarray, low, high) -> np.ndarray:
+    # inverse transform of the discrete uniform on [low, high], works elementwise on array bounds
+    span = np.asarray(high, dtype=np.int64) - low + 1
+    return low + np.minimum((u * span).astype(np.int64), span - 1)
+
+def sample_service_times(
+    batch: TagBatch,
+    registry: ExerciseRegistry,
+    seed: int | None = None,
+    random_stream: RandomStream = RandomStream.BATCH,
+    antithetic: bool = False,
+    rng: np.random.Generator | None = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Draws every tag's processing time (server setup + exercise run) and exit queue delay in a few
+    vectorised calls, as int64 ns arrays aligned with the batch.
+
+    BATCH draws the uniforms from a numpy Generator in batch order, TAG keys them to each tag id
+    (common random numbers across architectures). antithetic uses 1 - u instead of u.
+    rng lets a caller sampling chunk after chunk keep drawing from the same BATCH Generator.
+    """
+    n = len(batch)
+    ranges = np.array([registry.exercises[name] for name in batch.exercise_names], dtype=np.int64).reshape(-1, 2)
+
+    if random_stream == RandomStream.TAG:
+        if seed is None:
+            raise ValueError("random_stream TAG needs a seed.")
+        uniforms = np.stack([tag_uniforms(batch, seed, stream) for stream in range(3)]) if n > 0 else np.zeros((3, 0))
+    else:
+        uniforms = (rng if rng is not None else np.random.default_rng(seed)).random((3, n))
+
+    if antithetic:
+        uniforms = 1.0 - uniforms
+
+    setup = _uniform_integers(uniforms[0], SERVER_SETUP_TIME_MIN, SERVER_SETUP_TIME_MAX) * NS_PER_SECOND
+    run = _uniform_integers(uniforms[1], ranges[batch.exercise, 0], ranges[batch.exercise, 1]) * NS_PER_MS if n > 0 else np.zeros(0, dtype=np.int64)
+    exit_delay = _uniform_integers(uniforms[2], EXIT_QUEUE_PROCESS_TIME_MIN, EXIT_QUEUE_PROCESS_TIME_MAX) * NS_PER_MS
+
+    return setup + run, exit_delay
@@ -11,11 +11,10 @@ from common.model import PopulationType
 from datetime import datetime, timedelta
 from plot import *
 
-from queuing.antiPriorityQueue import AntiPriorityQueueSystem
-from queuing.waterfall import WaterfallQueueSystem
-from queuing.channelsAndDams import ChannelsAndDamsQueueSystem
-from queuing.calendarPriority import CalendarPriorityQueueSystem
+from queuing import QUEUE_SYSTEMS
+from queuing.metrics import GroupedMetrics
 from queuing.tools import *
+from replication import run_replications
 
 from pushs.generation import generate_pushes_cached
 
@@ -24,29 +23,26 @@ warnings.simplefilter(action='ignore', category=FutureWarning)
 warnings.simplefilter(action='ignore', category=pd.errors.SettingWithCopyWarning)
 
 SCENARIO_NAME = "Test"
+# independent seeds to run on top of the main one, stats_ci.json gets mean and confidence intervals
+REPLICATIONS = 1
 
 FOLDER = pathlib.Path(__file__).parent
 MEAN_TIMES = json.load(open(FOLDER /"mean_times.exe"))
 
-QUEUE_SYSTEMS = {
-    ArchitectureType.WATERFALL: WaterfallQueueSystem(),
-    ArchitectureType.ANTI_PRIORITY: AntiPriorityQueueSystem(),
-    ArchitectureType.CHANNELS_AND_DAMS: ChannelsAndDamsQueueSystem(),
-    ArchitectureType.CALENDAR_PRIORITY: CalendarPriorityQueueSystem(),
-}
-
 def main(inp : Input):
     path = "results/" + SCENARIO_NAME + "/"
     os.makedirs(path, exist_ok=True)
 
     queue_system = QUEUE_SYSTEMS.get(inp.architecture)
     df, rejected_df = queue_system.process(inp)
+    queue_system.servers.stats_dataframe().to_csv(path + "servers.csv", index=False)
 
     entry_occupancy_df = create_occupancy_by_population_dataframe(df)
     exit_occupancy_df = create_occupancy_by_population_dataframe(df, start_column="server_exit_time", end_column="queue_exit_time")
     entry_rejected_tags_df = create_rejected_tags_dataframe(rejected_df, reason="entry_queue_full")
     exit_rejected_tags_df = create_rejected_tags_dataframe(rejected_df, reason="exit_queue_full")
-    waiting_df = create_waiting_time_stats_dataframe(df)
+    metrics = GroupedMetrics(df)
+    waiting_df = metrics.waiting_time_stats()
 
     plot_queue_by_population_type(entry_occupancy_df, entry_rejected_tags_df, name=path + "entry_queue.png")
     plot_queue_by_population_type(exit_occupancy_df, exit_rejected_tags_df, name=path + "exit_queue.png")
@@ -57,22 +53,28 @@ def main(inp : Input):
         df_tags=df,
         rejected_df=rejected_df,
         occupancy_df=entry_occupancy_df,
-        output_file=stats_json_file
+        output_file=stats_json_file,
+        metrics=metrics
     )
 
-    #print(population_stats)
+    if REPLICATIONS > 1:
+        replication_stats = run_replications(inp, replications=REPLICATIONS)
+        with open(path + "stats_ci.json", "w") as f:
+            json.dump(replication_stats, f, indent=4)
 
-if __name__ == "__main__":
-    os.makedirs("results", exist_ok=True)
-    tags = generate_pushes_cached(invalidate = False)
+    #print(population_stats)
 
+def build_registry() -> ExerciseRegistry:
     registry = ExerciseRegistry(exercises={
         'Exo1': (5000, 10000),
     })
 
     for exercise, time in MEAN_TIMES.items():
         registry.exercises[exercise] = (time, time)
-    
+
+    return registry
+
+def build_calendar_config() -> CalendarPriorityConfig:
     ing_priority = PopulationCalendarPriority(
         population=PopulationType.ING,
         priority_schedules=[
@@ -123,5 +125,14 @@ if __name__ == "__main__":
             PopulationType.PREPA: [prepa_priority]
         }
     )
-    
-    main(Input(tags=tags, architecture=ArchitectureType.CALENDAR_PRIORITY, registry=registry, num_servers=200, population_queue_sizes={PopulationType.ING: 3000, PopulationType.PREPA: 600}, calendar_priority_config=calendar_config))
+
+    return calendar_config
+
+if __name__ == "__main__":
+    os.makedirs("results", exist_ok=True)
+    tags = generate_pushes_cached(invalidate = False)
+
+    registry = build_registry()
+    calendar_config = build_calendar_config()
+
+    main(Input.trusted(tags, architecture=ArchitectureType.CALENDAR_PRIORITY, registry=registry, num_servers=200, population_queue_sizes={PopulationType.ING: 3000, PopulationType.PREPA: 600}, calendar_priority_config=calendar_config))
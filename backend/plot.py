@@ -2,6 +2,8 @@ from matplotlib import pyplot as plt
 import pandas as pd
 import json
 
+from queuing.metrics import GroupedMetrics
+
 def get_population_types():
     return ["prepa", "ing_strong", "ing_mean"]
 
@@ -80,61 +82,20 @@ def compute_population_stats(
     df_tags: pd.DataFrame,
     rejected_df: pd.DataFrame,
     occupancy_df: pd.DataFrame,
-    output_file: str,
-    percentiles=[0.5, 0.9]
+    output_file: str | None,
+    percentiles=[0.5, 0.9],
+    metrics: GroupedMetrics | None = None
 ):
-    df_tags = df_tags.copy()
-    rejected_df = rejected_df.copy()
-    occupancy_df = occupancy_df.copy()
-
-    df_tags['arrival_hour'] = df_tags['queue_arrival_time'].dt.hour
-
-    summary = {}
-
-    populations = df_tags['population'].unique()
-
-    for pop in populations:
-        pop_tags = df_tags[df_tags['population'] == pop]
-
-        # Temps d'attente en minutes
-        pop_tags['waiting_time_min'] = (
-            pop_tags['server_arrival_time'] - pop_tags['queue_arrival_time']
-        ).dt.total_seconds() / 60
-
-        mean_wait = pop_tags['waiting_time_min'].mean()
-        max_wait = pop_tags['waiting_time_min'].max()
-        p_values = pop_tags['waiting_time_min'].quantile(percentiles)
-        P50_wait = p_values.get(0.5, None)
-        P90_wait = p_values.get(0.9, None)
-
-        if rejected_df.empty:
-            percent_rejected = "-"  # met un "-" si le DataFrame est vide
-        else:
-            pop_rejected = rejected_df[
-                (rejected_df['population'] == pop) &
-                (rejected_df['reason'] == 'entry_queue_full')
-            ]
-            percent_rejected = 100 * len(pop_rejected) / len(pop_tags) if len(pop_tags) > 0 else "-"
-
-        # Occupation moyenne de la queue d'entrée
-        pop_occ = occupancy_df[occupancy_df['population'] == pop]
-        avg_occupancy = pop_occ['queue_occupancy'].mean() if not pop_occ.empty else 0
+    # metrics lets the caller reuse the GroupedMetrics already built for the waiting time plot
+    if metrics is None:
+        metrics = GroupedMetrics(df_tags)
 
-        summary[pop] = {
-            'total_arrivals': len(pop_tags),
-            'percent_rejected': percent_rejected,
-            'waiting_time': {
-                'mean': mean_wait,
-                'max': max_wait,
-                'P50': P50_wait,
-                'P90': P90_wait
-            },
-            'avg_queue_occupancy': avg_occupancy
-        }
+    summary = metrics.population_stats(rejected_df, occupancy_df, percentiles)
 
     # Écriture JSON
-    with open(output_file, 'w') as f:
-        json.dump(summary, f, indent=4)
+    if output_file is not None:
+        with open(output_file, 'w') as f:
+            json.dump(summary, f, indent=4)
 
-    print(f"Population stats written to {output_file}")
+        print(f"Population stats written to {output_file}")
     return summary
@@ -0,0 +1,64 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import scipy
+from scipy.stats import t
+
+FIT_CACHE_FILE = "t_fits_cache.json"
+# part of every key: a different estimator or scipy version never reuses old fits
+FIT_METHOD = f"scipy.stats.t.fit:mle:{scipy.__version__}"
+
+def sample_key(hours, method: str = FIT_METHOD) -> str:
+    sample = np.ascontiguousarray(hours, dtype=np.float64)
+    return hashlib.sha256(method.encode() + sample.tobytes()).hexdigest()
+
+def fit_student(hours) -> tuple[float, float, float]:
+    df, loc, scale = t.fit(hours)
+    return float(df), float(loc), float(scale)
+
+def load_fits(path: str = FIT_CACHE_FILE) -> dict[str, list[float]]:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_fits(fits: dict[str, list[float]], path: str = FIT_CACHE_FILE):
+    with open(path + ".tmp", "w") as f:
+        json.dump(fits, f)
+    os.replace(path + ".tmp", path)
+
+def fit_exo_day_times(
+    exo_day_times: dict,
+    path: str | None = FIT_CACHE_FILE,
+    rebuild: bool = False,
+    max_workers: int | None = None
+) -> dict:
+    """
+    Student-t (df, loc, scale) of every (exercise, day) sample with at least two points.
+
+    Fits are cached in path under a hash of the sample and FIT_METHOD, so they are only computed
+    again when the scrapper data changes. Missing fits (all of them with rebuild) are computed in a
+    process pool, max_workers=1 fits in the current process. path=None disables the cache.
+    """
+    samples = {group: hours for group, hours in exo_day_times.items() if len(hours) >= 2}
+    keys = {group: sample_key(hours) for group, hours in samples.items()}
+
+    cache = {} if rebuild or path is None else load_fits(path)
+    missing = {key: samples[group] for group, key in keys.items() if key not in cache}
+
+    if missing:
+        print(f"Fitting {len(missing)} Student-t distributions ({len(set(keys.values())) - len(missing)} cached)")
+        if max_workers == 1 or len(missing) == 1:
+            fitted = map(fit_student, missing.values())
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+                fitted = list(pool.map(fit_student, missing.values(), chunksize=8))
+        cache.update(zip(missing.keys(), fitted))
+
+        if path is not None:
+            save_fits(cache, path)
+
+    return {group: tuple(cache[key]) for group, key in keys.items()}
@@ -1,22 +1,25 @@
-from datetime import datetime, timedelta
+from datetime import datetime
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
+import copy
+import hashlib
+import json
 import os
-import pickle
-from collections import Counter
+import shutil
+import tempfile
+import numpy as np
 
-from pushs.build_exo_times import get_exo_data
-from pushs.generation_prepa import generate_pushes_prepa
-from pushs.generation_ing import generate_pushes_ing
-
-def plot_pushes(pushes, prepa=False):
-    timestamps = [datetime.fromisoformat(p.time.isoformat()) for p in pushes]
+from common.model import TagBatch, TagStream
 
-    timestamps_minute = [dt.replace(second=0, microsecond=0) for dt in timestamps]
-    counts = Counter(timestamps_minute)
+from pushs.build_exo_times import get_exo_data
+from pushs.fit_cache import fit_exo_day_times
+from pushs.generation_prepa import generate_pushes_prepa, prepa_sources
+from pushs.generation_ing import generate_pushes_ing, ing_sources
+from pushs.stream import merge_tag_sources
 
-    sorted_times = sorted(counts.keys())
-    push_counts = [counts[t] for t in sorted_times]
+def plot_pushes(pushes: TagBatch, prepa=False):
+    sorted_times, push_counts = np.unique(pushes.datetimes().astype("datetime64[m]"), return_counts=True)
+    sorted_times = sorted_times.astype("datetime64[us]").tolist()
 
     plt.figure(figsize=(15, 6))
     plt.bar(sorted_times, push_counts, width=0.005 if prepa else 0.004, alpha=0.7)
@@ -68,41 +71,124 @@ PARAMS_PREPA = {
     "time_resolution_min": 5
 }
 
-CACHE_FILE = "pushes_cache.pkl"
+# one TagBatch folder per content hash, the least recently used ones beyond CACHE_MAX_ENTRIES are removed
+CACHE_DIR = "pushes_cache"
+CACHE_MAX_ENTRIES = 8
+# part of every cache key, bumped whenever the same parameters start giving different tags
+GENERATION_VERSION = 2
+
+def generation_params(overrides: dict | None = None) -> dict:
+    # copies of PARAMS_SCRAPPER / PARAMS_ING / PARAMS_PREPA with "scrapper.x", "ing.x" or "prepa.x" keys overridden
+    params = {
+        "scrapper": copy.deepcopy(PARAMS_SCRAPPER),
+        "ing": copy.deepcopy(PARAMS_ING),
+        "prepa": copy.deepcopy(PARAMS_PREPA),
+    }
+    for key, value in (overrides or {}).items():
+        section, name = key.split(".", 1)
+        params[section][name] = value
+    return params
+
+def generate_pushes(overrides: dict | None = None, plot: bool = True):
+    params = generation_params(overrides)
 
-def generate_pushes():
     # Get exo datas
     print("Compute stats from scrapper...")
-    exo_day_times, diffs = get_exo_data(PARAMS_SCRAPPER)
+    exo_day_times, diffs = get_exo_data(params["scrapper"])
 
     print("Generate ING tags...")
-    ing = generate_pushes_ing(PARAMS_ING, exo_day_times, diffs)
+    ing = generate_pushes_ing(params["ing"], exo_day_times, diffs)
     print("Total ING tags:", len(ing))
 
     print("Generate PREPA tags...")
-    prepa = generate_pushes_prepa(PARAMS_PREPA)
+    prepa = generate_pushes_prepa(params["prepa"])
     print("Total PREPA tags:", len(prepa))
 
-    plot_pushes(ing)
-    plot_pushes(prepa, True)
-
-    return ing + prepa
-
-def generate_pushes_cached(invalidate=False):
-    file = CACHE_FILE + "_" + str(PARAMS_ING["percentage_strong"])
+    if plot:
+        plot_pushes(ing)
+        plot_pushes(prepa, True)
+
+    return TagBatch.concat([ing, prepa]).sort()
+
+def generate_pushes_stream(overrides: dict | None = None) -> TagStream:
+    """
+    The tags of generate_pushes() with the same overrides, as a TagStream: both are built from the
+    same per (exercise, day) ING and per day PREPA sources, here each one is generated when the
+    merge reaches it, so the simulation starts right away and only the tags of the sources in
+    progress are held in memory.
+    """
+    params = generation_params(overrides)
+
+    exo_day_times, diffs = get_exo_data(params["scrapper"])
+    fits = fit_exo_day_times(exo_day_times)
+
+    sources = ing_sources(params["ing"], exo_day_times, diffs, fits) + prepa_sources(params["prepa"])
+    return TagStream(lambda: merge_tag_sources(sources))
+
+def scrapper_fingerprint(data_dir: str) -> str:
+    digest = hashlib.sha256()
+    for filename in sorted(os.listdir(data_dir)):
+        if filename.endswith(".json"):
+            digest.update(filename.encode())
+            with open(os.path.join(data_dir, filename), "rb") as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+def pushes_cache_key(overrides: dict | None = None) -> str:
+    # every generation parameter plus the scrapper data the ING fits come from
+    params = generation_params(overrides)
+    content = json.dumps(params, sort_keys=True, default=str) + scrapper_fingerprint(params["scrapper"]["data_dir"]) + f"v{GENERATION_VERSION}"
+    return hashlib.sha256(content.encode()).hexdigest()[:32]
+
+def _evict_pushes_cache(cache_dir: str, max_entries: int):
+    entries = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir)]
+    entries = [entry for entry in entries if os.path.exists(os.path.join(entry, "meta.json"))]
+    entries.sort(key=lambda entry: os.path.getmtime(os.path.join(entry, "meta.json")), reverse=True)
+
+    for entry in entries[max_entries:]:
+        print(f"Evicting pushes cache entry {entry}")
+        shutil.rmtree(entry, ignore_errors=True)
+
+def load_cache_entry(entry: str) -> TagBatch:
+    # every read of an entry goes through here: the meta.json mtime is the last use, for LRU eviction
+    pushes = TagBatch.load(entry)
+    os.utime(os.path.join(entry, "meta.json"))
+    return pushes
 
-    if not invalidate and os.path.exists(file):
-        print(f"Loading pushes from cache: {file}")
-        with open(file, "rb") as f:
-            pushes = pickle.load(f)
+def generate_pushes_cached(
+    invalidate=False,
+    overrides: dict | None = None,
+    cache_dir: str = CACHE_DIR,
+    max_entries: int = CACHE_MAX_ENTRIES,
+    plot: bool = True
+) -> TagBatch:
+    """
+    generate_pushes() through a content-addressed cache: the entry is keyed by a hash of all
+    generation parameters and of the scrapper data, and loaded back memory-mapped.
+    plot saves the push plots in results/ when the entry has to be generated.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    entry = os.path.join(cache_dir, pushes_cache_key(overrides))
+
+    if not invalidate and os.path.exists(os.path.join(entry, "meta.json")):
+        print(f"Loading pushes from cache: {entry}")
+        pushes = load_cache_entry(entry)
         print(f"Loaded {len(pushes)} pushes from cache.")
         return pushes
 
     print("Cache not found, generating pushes...")
-    pushes = generate_pushes()
-
-    with open(file, "wb") as f:
-        pickle.dump(pushes, f)
-    print(f"Saved {len(pushes)} pushes to cache: {file}")
-
-    return pushes
+    # written next to the entry then renamed, a reader never sees a partial entry
+    tmp = tempfile.mkdtemp(prefix=".tmp_", dir=cache_dir)
+    try:
+        pushes = generate_pushes(overrides, plot)
+        pushes.save(tmp)
+    except BaseException:
+        # eviction only knows complete entries, a failed one would stay forever
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    shutil.rmtree(entry, ignore_errors=True)
+    os.replace(tmp, entry)
+    print(f"Saved {len(pushes)} pushes to cache: {entry}")
+
+    _evict_pushes_cache(cache_dir, max_entries)
+    return TagBatch.load(entry)
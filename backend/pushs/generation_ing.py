@@ -1,75 +1,88 @@
-import json
-import os
-from datetime import datetime, timedelta
 import numpy as np
 from scipy.stats import t
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-from collections import Counter, defaultdict
 from common.model import *
-from uuid import UUID, uuid4
+from common.utils import uuid4_array, NS_PER_HOUR
+from pushs.fit_cache import fit_exo_day_times
+from uuid import UUID
 
-def generate_users(PARAMS):
+def generate_users(PARAMS, rng):
+    # (user ids, strength) of the cohort, strong users first
     n_strong = int(PARAMS["population_size"] * PARAMS["percentage_strong"])
     n_normal = PARAMS["population_size"] - n_strong
-    users = [{"id": uuid4(), "is_strong": True} for _ in range(n_strong)]
-    users += [{"id": uuid4(), "is_strong": False} for _ in range(n_normal)]
-    return users
+    ids = uuid4_array(n_strong + n_normal, rng)
+    strength = np.repeat(np.array([1, 0], dtype=np.int8), [n_strong, n_normal])
+    return [UUID(bytes=raw.tobytes()) for raw in ids], strength
 
-def pushes_per_person(PARAMS, is_strong, difficulty):
-    if is_strong:
-        base_mean = PARAMS["gamma_strong"]["base_mean"]
-        max_mean = PARAMS["gamma_strong"]["max_mean"]
-    else:
-        base_mean = PARAMS["gamma_normal"]["base_mean"]
-        max_mean = PARAMS["gamma_normal"]["max_mean"]
+def pushes_per_person(PARAMS, strength, difficulty, rng):
+    # number of pushes of every user for one exercise, a single gamma draw for the whole cohort
+    base_mean = np.where(strength == 1, PARAMS["gamma_strong"]["base_mean"], PARAMS["gamma_normal"]["base_mean"])
+    max_mean = np.where(strength == 1, PARAMS["gamma_strong"]["max_mean"], PARAMS["gamma_normal"]["max_mean"])
 
     mean = base_mean + difficulty * (max_mean - base_mean)
     shape = PARAMS["gamma_shape"]
     scale = mean / shape
 
-    pushes = np.random.gamma(shape, scale)
-    return max(1, int(round(pushes)))
+    pushes = rng.gamma(shape, scale)
+    return np.maximum(1, np.rint(pushes)).astype(np.int64)
 
-def generate_pushes_ing(PARAMS, exo_day_times, diffs):
-    PARAMS["nb_points"] = (PARAMS["window_end"] - PARAMS["window_start"]) * PARAMS["nb_points_per_hour"]
-
-    users = generate_users(PARAMS)
-    all_pushes = []
+def exo_day_pushes(PARAMS, day, fit, difficulty, strength, rng) -> tuple[np.ndarray, np.ndarray]:
+    # (times in int64 ns, user indices) of every push of the cohort on one (exercise, day)
+    df, loc, scale = fit
+    t_hours = np.linspace(0, PARAMS["window_end"] - PARAMS["window_start"], PARAMS["nb_points"])
+    density = t.pdf(t_hours, df=df, loc=loc, scale=scale)
+    density[density < 0] = 0
+    density /= density.sum()
 
-    for (exo_id, day), hours in exo_day_times.items():
-        if len(hours) < 2:
-            continue
+    day_start = (np.datetime64(day, "D") + np.timedelta64(PARAMS["window_start"], "h")).astype("datetime64[ns]").astype(np.int64)
 
-        difficulty = diffs[exo_id]
+    n_push = pushes_per_person(PARAMS, strength, difficulty, rng)
+    push_hours = t_hours[rng.choice(len(t_hours), size=n_push.sum(), p=density)]
+    if PARAMS["jitter_hours"]:
+        push_hours = push_hours + rng.normal(0, PARAMS["jitter_hours"], size=len(push_hours))
 
-        df, loc, scale = t.fit(hours)
-        t_hours = np.linspace(0, PARAMS["window_end"] - PARAMS["window_start"], PARAMS["nb_points"])
-        density = t.pdf(t_hours, df=df, loc=loc, scale=scale)
-        density[density < 0] = 0
-        density /= density.sum()
+    # rounded to the microsecond like the timedelta it replaces
+    times = day_start + np.rint(push_hours * NS_PER_HOUR / 1000).astype(np.int64) * 1000
+    return times, np.repeat(np.arange(len(strength)), n_push)
 
-        day_start_dt = datetime.combine(day, datetime.min.time()) + timedelta(hours=PARAMS["window_start"])
+def generate_pushes_ing(PARAMS, exo_day_times, diffs, fits=None) -> TagBatch:
+    # every source of ing_sources generated at once, so the batch and the stream hold the same tags
+    pushes = TagBatch.concat([chunk for _, factory in ing_sources(PARAMS, exo_day_times, diffs, fits) for chunk in factory()])
+    print("Number of different exos", len(pushes.exercise_names))
+    return pushes.sort()
 
-        for user in users:
-            n_push = pushes_per_person(PARAMS, user["is_strong"], difficulty)
-            push_times = np.random.choice(t_hours, size=n_push, p=density)
+def ing_sources(PARAMS, exo_day_times, diffs, fits=None) -> list[tuple[int, Callable[[], Iterable[TagBatch]]]]:
+    """
+    One lazy source per (exercise, day) for merge_tag_sources and generate_pushes_ing: (lower bound of its times, factory
+    yielding its pushes as a sorted TagBatch). Each source has its own child seed, so iterating
+    again gives the same tags. With jitter, pushes are clipped to 8 standard deviations before the window.
+    """
+    PARAMS["nb_points"] = (PARAMS["window_end"] - PARAMS["window_start"]) * PARAMS["nb_points_per_hour"]
+    seeds = np.random.SeedSequence(PARAMS.get("seed"))
+    if fits is None:
+        fits = fit_exo_day_times(exo_day_times)
 
-            for h in push_times:
-                dt = day_start_dt + timedelta(hours=float(h + np.random.normal(0, PARAMS["jitter_hours"])))
-                all_pushes.append(Tag(
-                    id=uuid4(),
-                    time=dt,
-                    population=PopulationType.ING,
-                    exercise_name=exo_id,
-                    user_id=user["id"],
-                    is_strong=user["is_strong"]
-                ))
+    user_ids, strength = generate_users(PARAMS, np.random.default_rng(seeds.spawn(1)[0]))
 
-    exo = defaultdict(int)
-    for p in all_pushes:
-        exo[p.exercise_name] += 1
+    groups = [(exo_id, day) for (exo_id, day), hours in exo_day_times.items() if len(hours) >= 2]
+    exercise_names = list(dict.fromkeys(exo_id for exo_id, _ in groups))
+    exercise_codes = {name: code for code, name in enumerate(exercise_names)}
+    population = POPULATION_CODES[PopulationType.ING]
 
-    print("Number of different exos", len(exo))
+    def source(exo_id, day, seed, lower_bound):
+        def factory():
+            rng = np.random.default_rng(seed)
+            times, users = exo_day_pushes(PARAMS, day, fits[(exo_id, day)], diffs[exo_id], strength, rng)
+            yield TagBatch(
+                uuid4_array(len(times), rng), np.maximum(times, lower_bound),
+                np.full(len(times), population, dtype=np.int8), strength[users],
+                np.full(len(times), exercise_codes[exo_id], dtype=np.int32), users,
+                exercise_names, user_ids,
+            ).sort()
+        return factory
 
-    return all_pushes
+    sources = []
+    for (exo_id, day), seed in zip(groups, seeds.spawn(len(groups))):
+        window_start = np.datetime64(day, "D") + np.timedelta64(PARAMS["window_start"], "h")
+        lower_bound = window_start.astype("datetime64[ns]").astype(np.int64) - int(8 * PARAMS["jitter_hours"] * NS_PER_HOUR)
+        sources.append((lower_bound, source(exo_id, day, seed, lower_bound)))
+    return sources
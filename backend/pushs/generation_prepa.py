@@ -1,21 +1,16 @@
 import numpy as np
-from datetime import datetime, timedelta
-from collections import Counter
-from uuid import uuid4
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
+from datetime import datetime
 from scipy.stats import t
 from common.model import *
-from uuid import UUID, uuid4
+from common.utils import uuid4_array, NS_PER_HOUR
+from uuid import UUID
 
-def generate_pushes_prepa(PARAMS):
+def prepa_density(PARAMS):
+    # (start_date, hours_grid, density_grid, total_pushes): the push density over the whole period
     start_date = PARAMS.get("start_date", datetime.today()).replace(
         hour=0, minute=0, second=0, microsecond=0
     )
 
-    users = [uuid4() for _ in range(PARAMS["population_size"])]
-    all_pushes = []
-
     total_days = PARAMS["nb_weeks"] * 7
     resolution = PARAMS["time_resolution_min"] / 60
 
@@ -53,21 +48,50 @@ def generate_pushes_prepa(PARAMS):
 
     density_grid /= density_grid.sum()
 
-    push_hours = np.random.choice(hours_grid, size=total_pushes, p=density_grid)
-
-    for h in push_hours:
-        day_offset = int(h // 24)
-        hour_in_day = h % 24
-        dt = start_date + timedelta(days=day_offset, hours=hour_in_day)
-        uid = np.random.choice(users)
-
-        all_pushes.append(Tag(
-            id=uuid4(),
-            time=dt,
-            population=PopulationType.PREPA,
-            exercise_name="Exo1",
-            user_id=uid,
-            is_strong=False
-        ))
-
-    return all_pushes
+    return start_date, hours_grid, density_grid, total_pushes
+
+def generate_pushes_prepa(PARAMS) -> TagBatch:
+    # every day of prepa_sources generated at once, so the batch and the stream hold the same tags
+    return TagBatch.concat([chunk for _, factory in prepa_sources(PARAMS) for chunk in factory()]).sort()
+
+def prepa_sources(PARAMS) -> list[tuple[int, Callable[[], Iterable[TagBatch]]]]:
+    """
+    One lazy source per calendar day for merge_tag_sources (and generate_pushes_prepa). The number
+    of pushes of each day is drawn upfront (multinomial over the day masses of the density grid),
+    each day then draws its pushes from its own part of the grid with its own child seed.
+    """
+    start_date, hours_grid, density_grid, total_pushes = prepa_density(PARAMS)
+    seeds = np.random.SeedSequence(PARAMS.get("seed"))
+    rng = np.random.default_rng(seeds.spawn(1)[0])
+
+    user_ids = [UUID(bytes=raw.tobytes()) for raw in uuid4_array(PARAMS["population_size"], rng)]
+    exercise_names = ["Exo1"]
+    start_ns = np.datetime64(start_date, "ns").astype(np.int64)
+
+    days = (hours_grid // 24).astype(np.int64)
+    day_mass = np.bincount(days, weights=density_grid)
+    day_counts = rng.multinomial(total_pushes, day_mass / day_mass.sum())
+
+    def source(day, count, seed):
+        def factory():
+            day_rng = np.random.default_rng(seed)
+            grid = hours_grid[days == day]
+            density = density_grid[days == day]
+            push_hours = grid[day_rng.choice(len(grid), size=count, p=density / density.sum())]
+            yield TagBatch(
+                uuid4_array(count, day_rng),
+                start_ns + np.rint(push_hours * NS_PER_HOUR / 1000).astype(np.int64) * 1000,
+                np.full(count, POPULATION_CODES[PopulationType.PREPA], dtype=np.int8),
+                np.zeros(count, dtype=np.int8),
+                np.zeros(count, dtype=np.int32),
+                day_rng.integers(0, len(user_ids), size=count),
+                exercise_names,
+                user_ids,
+            ).sort()
+        return factory
+
+    return [
+        (start_ns + day * 24 * NS_PER_HOUR, source(day, count, seed))
+        for day, (count, seed) in enumerate(zip(day_counts, seeds.spawn(len(day_counts))))
+        if count > 0
+    ]
@@ -0,0 +1,71 @@
+import heapq
+import itertools
+
+import numpy as np
+
+from common.model import *
+
+def _split(batch: TagBatch, k: int) -> tuple[TagBatch, TagBatch]:
+    # (first k tags, the rest) of a sorted batch, both still sorted
+    head, tail = batch.take(slice(0, k)), batch.take(slice(k, None))
+    head.is_sorted = tail.is_sorted = True
+    return head, tail
+
+class _ActiveSource:
+    __slots__ = ("buffer", "chunks", "done")
+
+    def __init__(self, chunks: Iterator[TagBatch]):
+        self.buffer = TagBatch.empty()
+        self.chunks = chunks
+        self.done = False
+        self.pull()
+
+    def pull(self):
+        # appends the next non-empty chunk of the source to its buffer, marks it done at the end
+        for chunk in self.chunks:
+            if len(chunk) > 0:
+                self.buffer = TagBatch.concat([self.buffer, chunk.sort()]).sort()
+                return
+        self.done = True
+
+def merge_tag_sources(sources: list[tuple[int, Callable[[], Iterable[TagBatch]]]]) -> Iterator[TagBatch]:
+    """
+    Lazy heap merge of time-ordered tag sources into one time-ordered stream of TagBatch chunks.
+
+    A source is (lower bound of its times in ns, factory returning its sorted chunks) and is only
+    started once the merge reaches its lower bound, so only the sources overlapping the current
+    instant are held in memory. Tags are emitted up to a watermark: the earliest of the pending
+    lower bounds and of the last buffered time of every running source, as nothing earlier can
+    come from them anymore.
+    """
+    order = itertools.count()
+    pending = [(lower_bound, next(order), factory) for lower_bound, factory in sources]
+    heapq.heapify(pending)
+    active = []
+
+    while pending or active:
+        bounds = [source.buffer.times[-1] for source in active if not source.done]
+        if pending:
+            bounds.append(pending[0][0])
+        # None once every source has been read to the end: flush what is left
+        watermark = min(bounds) if bounds else None
+
+        if pending and pending[0][0] <= watermark:
+            _, _, factory = heapq.heappop(pending)
+            active.append(_ActiveSource(iter(factory())))
+            continue
+
+        parts = []
+        for source in active:
+            k = len(source.buffer) if watermark is None else int(np.searchsorted(source.buffer.times, watermark, side="left"))
+            if k > 0:
+                part, source.buffer = _split(source.buffer, k)
+                parts.append(part)
+        if parts:
+            yield TagBatch.concat(parts).sort()
+
+        # the sources holding the watermark may still produce tags at that instant: read further
+        for source in active:
+            if not source.done and (len(source.buffer) == 0 or source.buffer.times[-1] == watermark):
+                source.pull()
+        active = [source for source in active if not source.done or len(source.buffer) > 0]
@@ -0,0 +1,13 @@
+from common.model import ArchitectureType
+
+from queuing.antiPriorityQueue import AntiPriorityQueueSystem
+from queuing.waterfall import WaterfallQueueSystem
+from queuing.channelsAndDams import ChannelsAndDamsQueueSystem
+from queuing.calendarPriority import CalendarPriorityQueueSystem
+
+QUEUE_SYSTEMS = {
+    ArchitectureType.WATERFALL: WaterfallQueueSystem(),
+    ArchitectureType.ANTI_PRIORITY: AntiPriorityQueueSystem(),
+    ArchitectureType.CHANNELS_AND_DAMS: ChannelsAndDamsQueueSystem(),
+    ArchitectureType.CALENDAR_PRIORITY: CalendarPriorityQueueSystem(),
+}
@@ -0,0 +1,246 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from common.utils import NS_PER_MS, NS_PER_MINUTE
+from queuing.tools import ns_to_datetime64
+
+class LogHistogram:
+    """
+    Mergeable quantile sketch with logarithmic buckets (HDR / DDSketch style).
+
+    Values below `low` (in ns) fall into a zero bucket, larger ones into buckets whose bounds
+    grow by a constant factor, so any quantile is returned within relative_error of a value of
+    the bucket it falls in. Only non-empty buckets are stored, count / sum / min / max are exact.
+    """
+
+    __slots__ = ("relative_error", "low", "counts", "count", "total", "min", "max", "_gamma", "_log_gamma")
+
+    def __init__(self, relative_error: float = 0.01, low: int = NS_PER_MS):
+        self.relative_error = relative_error
+        self.low = low
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self._gamma = (1 + relative_error) / (1 - relative_error)
+        self._log_gamma = math.log(self._gamma)
+
+    def _index(self, value: int) -> int:
+        if value < self.low:
+            return 0
+        return 1 + int(math.log(value / self.low) / self._log_gamma)
+
+    def _value(self, index: int) -> float:
+        if index == 0:
+            return 0.0
+        lower = self.low * self._gamma ** (index - 1)
+        return 2 * lower * self._gamma / (1 + self._gamma)
+
+    def add(self, value: int, count: int = 1):
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.count += count
+        self.total += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def add_many(self, values: np.ndarray):
+        values = np.asarray(values, dtype=np.int64)
+        if len(values) == 0:
+            return
+
+        indices = np.zeros(len(values), dtype=np.int64)
+        above = values >= self.low
+        indices[above] = 1 + (np.log(values[above] / self.low) / self._log_gamma).astype(np.int64)
+
+        for index, count in zip(*np.unique(indices, return_counts=True)):
+            self.counts[int(index)] = self.counts.get(int(index), 0) + int(count)
+        self.count += len(values)
+        self.total += int(values.sum())
+        self.min = int(values.min()) if self.min is None else min(self.min, int(values.min()))
+        self.max = int(values.max()) if self.max is None else max(self.max, int(values.max()))
+
+    def merge(self, other: "LogHistogram"):
+        if (other.relative_error, other.low) != (self.relative_error, self.low):
+            raise ValueError("Only histograms with the same relative error and low bound can be merged.")
+        if other.count == 0:
+            return self
+
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+    def mean(self) -> float | None:
+        return self.total / self.count if self.count else None
+
+    def quantiles(self, qs: list[float]) -> list[float | None]:
+        # same rank convention as pandas' linear quantile: q * (count - 1), in ns
+        if self.count == 0:
+            return [None] * len(qs)
+
+        indices = sorted(self.counts)
+        cumulative = np.cumsum([self.counts[index] for index in indices])
+
+        results = []
+        for q in qs:
+            rank = q * (self.count - 1)
+            bucket = indices[int(np.searchsorted(cumulative, rank, side="right"))]
+            results.append(min(max(self._value(bucket), self.min), self.max))
+        return results
+
+    def quantile(self, q: float) -> float | None:
+        return self.quantiles([q])[0]
+
+class MetricsAccumulator:
+    """
+    Online replacement for compute_population_stats / create_waiting_time_stats_dataframe /
+    create_rejected_tags_dataframe: records are added one at a time (times in int64 ns) and only
+    per population and per time bucket aggregates are kept.
+
+    The occupancy samples follow create_occupancy_by_population_dataframe: every freq from the
+    first accepted arrival (the earliest one, servers start free) up to the last server arrival.
+    merge() pools other runs (replications): counts and histograms add up and the average
+    occupancy is averaged over the runs. With same_run, other is another part of the same run
+    (e.g. built from other partitions with the same origin) and only adds up.
+    """
+
+    def __init__(self, freq: int = 10 * NS_PER_MINUTE, relative_error: float = 0.01):
+        self.freq = freq
+        self.relative_error = relative_error
+        self.runs = 1
+
+        self.waiting = {}
+        self.bucket_waiting = {}
+        self.rejected = {}
+        self.bucket_rejected = {}
+
+        self.origin = None
+        self.end = None
+        self.occupancy = {}
+
+    def _histogram(self) -> LogHistogram:
+        return LogHistogram(self.relative_error)
+
+    def accept(self, population: str, queue_arrival_time: int, server_arrival_time: int):
+        wait = server_arrival_time - queue_arrival_time
+
+        histogram = self.waiting.get(population)
+        if histogram is None:
+            histogram = self.waiting[population] = self._histogram()
+        histogram.add(wait)
+
+        key = (queue_arrival_time // self.freq, population)
+        histogram = self.bucket_waiting.get(key)
+        if histogram is None:
+            histogram = self.bucket_waiting[key] = self._histogram()
+        histogram.add(wait)
+
+        if self.origin is None:
+            self.origin = queue_arrival_time
+        self.end = server_arrival_time if self.end is None else max(self.end, server_arrival_time)
+
+        # the tag is counted by the samples k with start <= origin + k * freq < end
+        first = -((self.origin - queue_arrival_time) // self.freq)
+        last = -((self.origin - server_arrival_time) // self.freq)
+        if first < last:
+            diff = self.occupancy.setdefault(population, {})
+            diff[first] = diff.get(first, 0) + 1
+            diff[last] = diff.get(last, 0) - 1
+
+    def reject(self, population: str, queue_arrival_time: int, reason: str):
+        key = (population, reason)
+        self.rejected[key] = self.rejected.get(key, 0) + 1
+
+        key = (queue_arrival_time // self.freq, population, reason)
+        self.bucket_rejected[key] = self.bucket_rejected.get(key, 0) + 1
+
+    def merge(self, other: "MetricsAccumulator", same_run: bool = False) -> "MetricsAccumulator":
+        if (other.freq, other.relative_error) != (self.freq, self.relative_error):
+            raise ValueError("Only accumulators with the same freq and relative error can be merged.")
+        if self.origin is not None and other.origin is not None and other.origin != self.origin:
+            raise ValueError("Accumulators must share the same occupancy origin to be merged.")
+
+        for mine, theirs in ((self.waiting, other.waiting), (self.bucket_waiting, other.bucket_waiting)):
+            for key, histogram in theirs.items():
+                mine.setdefault(key, self._histogram()).merge(histogram)
+
+        for mine, theirs in ((self.rejected, other.rejected), (self.bucket_rejected, other.bucket_rejected)):
+            for key, count in theirs.items():
+                mine[key] = mine.get(key, 0) + count
+
+        for population, diff in other.occupancy.items():
+            mine = self.occupancy.setdefault(population, {})
+            for k, delta in diff.items():
+                mine[k] = mine.get(k, 0) + delta
+
+        self.origin = self.origin if self.origin is not None else other.origin
+        if other.end is not None:
+            self.end = other.end if self.end is None else max(self.end, other.end)
+        if not same_run:
+            self.runs += other.runs
+        return self
+
+    def average_occupancy(self, population: str) -> float:
+        if self.origin is None or population not in self.occupancy:
+            return 0
+        samples = (self.end - self.origin) // self.freq + 1
+
+        total, level = 0, 0
+        previous = 0
+        for k in sorted(self.occupancy[population]):
+            if k >= samples:
+                break
+            if k > previous:
+                total += level * (k - previous)
+                previous = k
+            level += self.occupancy[population][k]
+        total += level * (samples - previous)
+        return total / samples / self.runs
+
+    def population_stats(self, percentiles: list[float] = [0.5, 0.9, 0.99, 0.999]) -> dict:
+        # same layout as compute_population_stats, quantiles are within relative_error
+        any_rejected = bool(self.rejected)
+
+        summary = {}
+        for population, histogram in self.waiting.items():
+            values = dict(zip(percentiles, histogram.quantiles(percentiles)))
+            rejected = self.rejected.get((population, "entry_queue_full"), 0)
+
+            summary[population] = {
+                'total_arrivals': histogram.count,
+                'percent_rejected': 100 * rejected / histogram.count if any_rejected else "-",
+                'waiting_time': {
+                    'mean': histogram.mean() / NS_PER_MINUTE,
+                    'max': histogram.max / NS_PER_MINUTE,
+                    **{f"P{q * 100:g}": value / NS_PER_MINUTE for q, value in values.items()}
+                },
+                'avg_queue_occupancy': self.average_occupancy(population)
+            }
+        return summary
+
+    def waiting_time_stats_dataframe(self, p: float = 0.9) -> pd.DataFrame:
+        keys = sorted(self.bucket_waiting)
+        quantiles = [self.bucket_waiting[key].quantiles([0.5, p]) for key in keys]
+
+        return pd.DataFrame({
+            "time": ns_to_datetime64([bucket * self.freq for bucket, _ in keys]),
+            "population": [population for _, population in keys],
+            "median": [median / NS_PER_MINUTE for median, _ in quantiles],
+            "p90": [high / NS_PER_MINUTE for _, high in quantiles],
+        })
+
+    def rejected_tags_dataframe(self, reason: str = "entry_queue_full") -> pd.DataFrame:
+        keys = sorted(key for key in self.bucket_rejected if key[2] == reason)
+
+        return pd.DataFrame({
+            "time": ns_to_datetime64([bucket * self.freq for bucket, _, _ in keys]),
+            "population": [population for _, population, _ in keys],
+            "rejected_count": [self.bucket_rejected[key] for key in keys],
+        })
@@ -1,147 +1,84 @@
-from datetime import timedelta
 from queuing.hierarchy import *
+from queuing.kernel import DispatchPolicy
 from common.model import *
 from common.utils import *
-from pandas import DataFrame
-import pandas as pd
-import math
-import logging
 
 from collections import deque
-from queuing.tools import *
 
-import random
+class PopulationHistory:
+    """
+    Sliding window over the populations of the last accepted tags, with per-population counters
+    updated on append and eviction so a weight costs O(1) whatever the window size.
+    The window is bounded by a number of tags, a duration, or both.
+    """
 
-class AntiPriorityQueueSystem(QueueSystem):
-    @property
-    def name(self) -> str:
-        return "Anti Priority Queue System"
-    
-    @property
-    def description(self) -> str:
-        return "A queuing system that prioritizes tasks with less elements to process, finite single queues (in and out)."
-    
-    @property
-    def architecture_type(self) -> ArchitectureType:
-        return ArchitectureType.ANTI_PRIORITY
-
-    def process(self, inp : Input) -> tuple[DataFrame, DataFrame]:
-        # create df with columns population, queue_arrival_time, server_arrival_time, server_exit_time, queue_exit_time
-        # in anti-priority, N entry queue, atleast one for ING and one for PREPA, K server, 1 exit queue
-
-        K = inp.num_servers
-        servers = deque([datetime.min for _ in range(K)])
-
-        population_queue_sizes = inp.population_queue_sizes
-        
-        queues = {
-            population: deque()
-            for population in population_queue_sizes.keys()
-        }
-
-        base_weights = {
-            population: 1
-            for population in population_queue_sizes.keys()
-        }
-
-        current_weight = base_weights.copy()
-
-        tags_history = deque(maxlen=100)
-        sorted_tags = sorted(inp.tags, key=lambda tag: tag.time)
-
-        df_list = []
-        rejected_df_list = []
-
-        sorted_tags = sorted(inp.tags, key=lambda tag: tag.time)
-        step = len(sorted_tags) // 10
-
-        entry_occupancies = {
-            PopulationType.ING: deque(),
-            PopulationType.PREPA: deque()
-        }
-
-        exit_occupancies = {
-            PopulationType.ING: deque(),
-            PopulationType.PREPA: deque()
-        }
+    def __init__(self, max_length: int | None = 100, window_ns: int | None = None):
+        self.max_length = max_length
+        self.window_ns = window_ns
+        self._entries = deque()
+        self._counts = {}
 
-        for i, tag in enumerate(sorted_tags):
-            if (i+1) % step == 0:
-                logging.info(f"Processing tag {i+1}/{len(sorted_tags)}")
+    def __len__(self):
+        return len(self._entries)
 
-            queues[tag.population].append(tag)
-            current_time = tag.time
+    def count(self, population: PopulationType) -> int:
+        return self._counts.get(population, 0)
 
-            for pop in entry_occupancies.keys():
-                while len(entry_occupancies[pop]) > 0 and entry_occupancies[pop][0] <= current_time:
-                    entry_occupancies[pop].popleft()
-                while len(exit_occupancies[pop]) > 0 and exit_occupancies[pop][0][1] <= current_time:
-                    exit_occupancies[pop].popleft()
+    def append(self, time: int, population: PopulationType):
+        self._entries.append((time, population))
+        self._counts[population] = self._counts.get(population, 0) + 1
 
-            populations = list(queues.keys())
-            weights = [current_weight[population] if len(queues[population]) > 0 else 0 for population in populations]
-            
-            total_weight = sum(weights)
-            if total_weight == 0:
-                break
-            probabilities = [weight / total_weight for weight in weights]
+        if self.max_length is not None and len(self._entries) > self.max_length:
+            self._evict()
 
-            selected_population = populations[probabilities.index(max(probabilities))] # random.choices(populations, weights=probabilities, k=1)[0]
+    def expire(self, time: int):
+        if self.window_ns is None:
+            return
+        while self._entries and self._entries[0][0] <= time - self.window_ns:
+            self._evict()
 
-            tag = queues[selected_population].popleft()
+    def weight(self, population: PopulationType) -> int:
+        # the less a population was served recently, the heavier it gets
+        return max(1, len(self._entries) - self.count(population))
 
-            entry_queue_count_at_time = len(entry_occupancies[selected_population])
-            exit_queue_count_at_time = sum(
-                1 for entry_time, exit_time in exit_occupancies[selected_population]
-                if entry_time <= current_time < exit_time
-            )
+    def _evict(self):
+        _, population = self._entries.popleft()
+        self._counts[population] -= 1
 
-            if entry_queue_count_at_time >= population_queue_sizes[selected_population]:
-                rejected_df_list.append({ "tag_id": tag.id, "population": get_population(tag.population, tag.is_strong), "exercise_name": tag.exercise_name, "queue_arrival_time": tag.time, "reason": "entry_queue_full" })
-                continue
+class AntiPriorityPolicy(DispatchPolicy):
+    # in anti-priority, N entry queue, atleast one for ING and one for PREPA, K server, 1 exit queue
+    # the population served the least over the recent history goes first
 
-            if exit_queue_count_at_time >= population_queue_sizes[selected_population]:
-                rejected_df_list.append({ "tag_id": tag.id, "population": get_population(tag.population, tag.is_strong), "exercise_name": tag.exercise_name, "queue_arrival_time": tag.time, "reason": "exit_queue_full" })
-                continue
+    def __init__(self, inp : Input):
+        history_window = to_ns(inp.history_window) if inp.history_window is not None else None
+        self.tags_history = PopulationHistory(inp.history_length, history_window)
 
-            queue_arrival_time = tag.time
-
-            server_available_time = servers.popleft()
-            server_arrival_time = max(queue_arrival_time, server_available_time)
-
-            pmin, pmax = inp.registry.exercises[tag.exercise_name]
-            processing_time = random_server_setup_delta() + timedelta(milliseconds=random.randint(pmin, pmax))
-            server_exit_time = server_arrival_time + processing_time
-
-            queue_exit_time = server_exit_time + random_exit_queue_process_delta()
-
-            entry_occupancies[selected_population].append(server_arrival_time)
-            exit_occupancies[selected_population].append((server_exit_time, queue_exit_time))
-
-            servers.append(server_exit_time)
-
-            tags_history.append(tag)
-            
-            population_counts = {}
-            for t in tags_history:
-                population_counts[t.population] = population_counts.get(t.population, 0) + 1
-            for population in current_weight.keys():
-                count_in_history = population_counts.get(population, 0)
-                current_weight[population] = max(1, len(tags_history) - count_in_history)
-   
-            df_list.append({
-                "tag_id": tag.id,
-                "population": get_population(tag.population, tag.is_strong),
-                "exercise_name": tag.exercise_name,
-                "queue_arrival_time": queue_arrival_time,
-                "server_arrival_time": server_arrival_time,
-                "server_exit_time": server_exit_time,
-                "queue_exit_time": queue_exit_time
-            })
-
-        return DataFrame(df_list), DataFrame(rejected_df_list)
+    def select(self, now: int, queues: dict[PopulationType, deque]) -> PopulationType | None:
+        self.tags_history.expire(now)
 
+        selected = None
+        selected_weight = 0
+        for population, queue in queues.items():
+            weight = self.tags_history.weight(population) if len(queue) > 0 else 0
+            if weight > selected_weight:
+                selected, selected_weight = population, weight
+        return selected
 
+    def on_dispatch(self, now: int, population: PopulationType, tag: int):
+        self.tags_history.append(now, population)
 
+class AntiPriorityQueueSystem(QueueSystem):
+    @property
+    def name(self) -> str:
+        return "Anti Priority Queue System"
+    
+    @property
+    def description(self) -> str:
+        return "A queuing system that prioritizes tasks with less elements to process, finite single queues (in and out)."
+    
+    @property
+    def architecture_type(self) -> ArchitectureType:
+        return ArchitectureType.ANTI_PRIORITY
 
-        
\ No newline at end of file
+    def create_policy(self, inp : Input) -> DispatchPolicy:
+        return AntiPriorityPolicy(inp)
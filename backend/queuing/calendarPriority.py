@@ -1,22 +1,16 @@
-from datetime import timedelta
+from datetime import date
 from queuing.hierarchy import *
+from queuing.kernel import DispatchPolicy
 from common.model import *
 from common.utils import *
-from pandas import DataFrame
-import pandas as pd
-import math
-import logging
+import numpy as np
 
 from collections import deque
-from queuing.tools import *
-
-import random
 
 def get_priority_for_time(current_time: datetime, priority_schedules: List[Tuple[Tuple[datetime], float]]) -> float:
-    day_of_week = current_time.weekday()
-    hour = current_time.hour
-    minute = current_time.minute
-    
+    return get_priority_for_minute(current_time.weekday(), current_time.hour, current_time.minute, priority_schedules)
+
+def get_priority_for_minute(day_of_week: int, hour: int, minute: int, priority_schedules: List[Tuple[Tuple[datetime], float]]) -> float:
     for schedule in priority_schedules:
         (start, end), priority = schedule
         start_day, start_hour, start_min = start
@@ -36,6 +30,72 @@ def get_priority_for_time(current_time: datetime, priority_schedules: List[Tuple
     
     return 0.0
 
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+# 1970-01-01 (epoch day 0) was a Thursday
+EPOCH_WEEKDAY = 3
+
+class CompiledCalendar:
+    """
+    CalendarPriorityConfig compiled once into a dense minute-of-week table (one row of
+    10,080 priorities per population), so a lookup is a single array index.
+    Date exceptions are stored as whole-day rows keyed by epoch day and replace the weekly row on that day.
+    """
+
+    def __init__(self, config: CalendarPriorityConfig):
+        self.weekly = np.zeros((len(POPULATIONS), MINUTES_PER_WEEK))
+
+        for population, population_priorities in config.priorities.items():
+            row = self.weekly[POPULATION_CODES[population]]
+            for minute_of_week in range(MINUTES_PER_WEEK):
+                day_of_week, minute_of_day = divmod(minute_of_week, MINUTES_PER_DAY)
+                for pop_priority in population_priorities:
+                    priority = get_priority_for_minute(day_of_week, minute_of_day // 60, minute_of_day % 60, pop_priority.priority_schedules)
+                    if priority > 0:
+                        row[minute_of_week] = priority
+                        break
+
+        self.exceptions = {}
+        for exception in config.exceptions:
+            epoch_day = (exception.day - date(1970, 1, 1)).days
+            if epoch_day not in self.exceptions:
+                weekly_start = ((epoch_day + EPOCH_WEEKDAY) % 7) * MINUTES_PER_DAY
+                self.exceptions[epoch_day] = self.weekly[:, weekly_start:weekly_start + MINUTES_PER_DAY].copy()
+
+            start = exception.start[0] * 60 + exception.start[1]
+            end = exception.end[0] * 60 + exception.end[1]
+            self.exceptions[epoch_day][POPULATION_CODES[exception.population], start:end] = exception.priority
+
+    def priority(self, time: int, population_code: int) -> float:
+        minutes = time // NS_PER_MINUTE
+        if self.exceptions:
+            day, minute_of_day = divmod(minutes, MINUTES_PER_DAY)
+            if day in self.exceptions:
+                return self.exceptions[day][population_code, minute_of_day]
+        return self.weekly[population_code, (minutes + EPOCH_WEEKDAY * MINUTES_PER_DAY) % MINUTES_PER_WEEK]
+
+class CalendarPriorityPolicy(DispatchPolicy):
+    # weight of a population = its calendar priority at dispatch time * its queue length
+
+    def __init__(self, inp : Input):
+        self.calendar = CompiledCalendar(inp.calendar_priority_config)
+
+    def select(self, now: int, queues: dict[PopulationType, deque]) -> PopulationType | None:
+        selected = None
+        selected_weight = 0
+        longest = None
+        for population, queue in queues.items():
+            if len(queue) == 0:
+                continue
+            weight = self.calendar.priority(now, POPULATION_CODES[population]) * len(queue)
+            if weight > selected_weight:
+                selected, selected_weight = population, weight
+            if longest is None or len(queue) > len(queues[longest]):
+                longest = population
+
+        # a zero priority only means last in line, never that the tag waits forever
+        return selected if selected is not None else longest
+
 class CalendarPriorityQueueSystem(QueueSystem):
     @property
     def name(self) -> str:
@@ -47,116 +107,9 @@ class CalendarPriorityQueueSystem(QueueSystem):
 
     @property
     def architecture_type(self) -> ArchitectureType:
-        return ArchitectureType.WATERFALL
+        return ArchitectureType.CALENDAR_PRIORITY
 
-    def process(self, inp : Input) -> tuple[DataFrame, DataFrame]:
+    def create_policy(self, inp : Input) -> DispatchPolicy:
         if inp.calendar_priority_config is None:
             raise ValueError("Calendar priority config must be provided for Calendar Priority architecture.")
-        
-        K = inp.num_servers
-        servers = deque([datetime.min for _ in range(K)])
-
-        population_queue_sizes = inp.population_queue_sizes
-        
-        queues = {
-            population: deque()
-            for population in population_queue_sizes.keys()
-        }
-
-        df_list = []
-        rejected_df_list = []
-
-        sorted_tags = sorted(inp.tags, key=lambda tag: tag.time)
-        step = len(sorted_tags) // 10
-
-        entry_occupancies = {
-            PopulationType.ING: deque(),
-            PopulationType.PREPA: deque()
-        }
-
-        exit_occupancies = {
-            PopulationType.ING: deque(),
-            PopulationType.PREPA: deque()
-        }
-
-        for i, tag in enumerate(sorted_tags):
-            if (i+1) % step == 0:
-                logging.info(f"Processing tag {i+1}/{len(sorted_tags)}")
-
-            queues[tag.population].append(tag)
-            current_time = tag.time
-
-            for pop in entry_occupancies.keys():
-                while len(entry_occupancies[pop]) > 0 and entry_occupancies[pop][0] <= current_time:
-                    entry_occupancies[pop].popleft()
-                while len(exit_occupancies[pop]) > 0 and exit_occupancies[pop][0][1] <= current_time:
-                    exit_occupancies[pop].popleft()
-
-            populations = list(queues.keys())
-
-            weights = []
-            for population in populations:
-                queue_size = len(queues[population])
-                if queue_size == 0:
-                    weights.append(0)
-                    continue
-                
-                population_priorities = inp.calendar_priority_config.priorities.get(population, [])
-                priority = 0.0
-                for pop_priority in population_priorities:
-                    priority = get_priority_for_time(current_time, pop_priority.priority_schedules)
-                    if priority > 0:
-                        break
-                
-                weight = priority * queue_size
-                weights.append(weight)
-
-            total_weight = sum(weights)
-            if total_weight == 0:
-                break
-            probabilities = [weight / total_weight for weight in weights]
-
-            selected_population = populations[probabilities.index(max(probabilities))] # random.choices(populations, weights=probabilities, k=1)[0]
-
-            tag = queues[selected_population].popleft()
-            
-            entry_queue_count_at_time = len(entry_occupancies[selected_population])
-            exit_queue_count_at_time = sum(
-                1 for entry_time, exit_time in exit_occupancies[selected_population]
-                if entry_time <= current_time < exit_time
-            )
-
-            if entry_queue_count_at_time >= population_queue_sizes[selected_population]:
-                rejected_df_list.append({ "tag_id": tag.id, "population": get_population(tag.population, tag.is_strong), "exercise_name": tag.exercise_name, "queue_arrival_time": tag.time, "reason": "entry_queue_full" })
-                continue
-
-            if exit_queue_count_at_time >= population_queue_sizes[selected_population]:
-                rejected_df_list.append({ "tag_id": tag.id, "population": get_population(tag.population, tag.is_strong), "exercise_name": tag.exercise_name, "queue_arrival_time": tag.time, "reason": "exit_queue_full" })
-                continue
-
-            queue_arrival_time = tag.time
-
-            server_available_time = servers.popleft()
-            server_arrival_time = max(queue_arrival_time, server_available_time)
-
-            pmin, pmax = inp.registry.exercises[tag.exercise_name]
-            processing_time = random_server_setup_delta() + timedelta(milliseconds=random.randint(pmin, pmax))
-            server_exit_time = server_arrival_time + processing_time
-            queue_exit_time = server_exit_time + random_exit_queue_process_delta()
-
-            entry_occupancies[selected_population].append(server_arrival_time)
-            exit_occupancies[selected_population].append((server_exit_time, queue_exit_time))
-
-            servers.append(server_exit_time)
-
-            df_list.append({
-                "tag_id": tag.id,
-                "population": get_population(tag.population, tag.is_strong),
-                "exercise_name": tag.exercise_name,
-                "queue_arrival_time": queue_arrival_time,
-                "server_arrival_time": server_arrival_time,
-                "server_exit_time": server_exit_time,
-                "queue_exit_time": queue_exit_time
-            })
-        
-        return DataFrame(df_list), DataFrame(rejected_df_list)
+        return CalendarPriorityPolicy(inp)
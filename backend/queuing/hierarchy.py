@@ -1,8 +1,13 @@
 from abc import ABC, abstractmethod
 from common.model import *
 from pandas import DataFrame
+from queuing.kernel import DispatchPolicy, SimulationKernel
+from queuing.sink import ResultSink
 
 class QueueSystem(ABC):
+    # ServerPool of the last process() call, kept for per-server reporting
+    servers = None
+
     @property
     def name(self) -> str:
         pass
@@ -16,5 +21,15 @@ class QueueSystem(ABC):
         pass
 
     @abstractmethod
+    def create_policy(self, inp : Input) -> DispatchPolicy:
+        pass
+
     def process(self, inp : Input) -> tuple[DataFrame, DataFrame]:
-        pass
\ No newline at end of file
+        return self.process_to(inp, None)
+
+    def process_to(self, inp : Input, sink : ResultSink | None):
+        # streams the records into sink (e.g. a PartitionedSink for long horizons) and returns sink.close()
+        kernel = SimulationKernel(inp, self.create_policy(inp), sink)
+        result = kernel.run()
+        self.servers = kernel.servers
+        return result
\ No newline at end of file
@@ -0,0 +1,184 @@
+import heapq
+import logging
+from abc import ABC, abstractmethod
+from collections import deque
+
+from common.model import *
+from common.utils import *
+from queuing.serverPool import ServerPool
+from queuing.sink import ResultSink, DataFrameSink
+
+# events sharing the same instant are handled in this order: a tag leaving the exit queue
+# or a server finishing frees capacity before an arrival at that same instant is checked
+EXIT_COMPLETE = 0
+SERVER_FREE = 1
+
+class DispatchPolicy(ABC):
+    """
+    Decides which population queue a free server takes its next tag from.
+    Everything else (queues, capacities, servers, service times, results) lives in SimulationKernel.
+    """
+
+    # False means unbounded entry/exit queues, no rejections
+    finite_queues = True
+    # False means tags leave as soon as the server is done, without an exit queue delay
+    exit_queue = True
+
+    def prepare(self, kernel: "SimulationKernel"):
+        pass
+
+    @abstractmethod
+    def select(self, now: int, queues: dict[PopulationType, deque]) -> PopulationType | None:
+        # only called when at least one queue holds a tag and a server is free at now
+        pass
+
+    def on_dispatch(self, now: int, population: PopulationType, tag: int):
+        pass
+
+# progress is logged every LOG_EVERY tags when the total is unknown (streamed tags)
+LOG_EVERY = 100_000
+
+class SimulationKernel:
+    """
+    Discrete-event simulation shared by every architecture.
+
+    Arrivals come from inp.tag_chunks() (sorted TagBatch chunks in time order, a single chunk unless
+    the tags are a TagStream), server-free and exit-complete events from a heapq calendar. Entry
+    queues are checked at arrival, and a dispatch decision is taken whenever a tag is waiting while
+    a server is free: on arrival, or when a server actually frees up.
+    Tags are numbered in arrival order across chunks, and only the tags waiting in a queue are kept
+    in times / processing_times / exit_delays, so memory follows the tags in flight.
+    Records go to sink as they are produced, a DataFrameSink unless told otherwise.
+    """
+
+    def __init__(self, inp: Input, policy: DispatchPolicy, sink: ResultSink | None = None):
+        self.inp = inp
+        self.policy = policy
+        self.sink = sink if sink is not None else DataFrameSink()
+
+        # arrival time, service time and exit delay of every waiting tag
+        self.times = {}
+        self.processing_times = {}
+        self.exit_delays = {}
+
+        self.servers = ServerPool(inp.num_servers)
+
+        populations = list(inp.population_queue_sizes.keys()) if inp.population_queue_sizes else POPULATIONS
+        self.queues = {population: deque() for population in populations}
+        self.exit_counts = {population: 0 for population in populations}
+
+        if policy.finite_queues:
+            if inp.population_queue_sizes is None:
+                raise ValueError("Population queue sizes must be specified for finite queue architectures.")
+            self.queue_sizes = inp.population_queue_sizes
+        else:
+            self.queue_sizes = None
+
+        self._events = []
+        self._sequence = 0
+        self._waiting = 0
+
+    def run(self):
+        # returns whatever the sink returns, (df, rejected_df) for the default DataFrameSink
+        inp = self.inp
+        chunks = inp.tag_chunks()
+        total = sum(len(chunk) for chunk in chunks) if isinstance(chunks, list) else None
+        step = total // 10 if total is not None else LOG_EVERY
+        rng = np.random.default_rng(inp.seed)
+        seed = inp.seed
+        if inp.random_stream == RandomStream.TAG and seed is None:
+            # drawn once so that every chunk of the run keys its draws the same way
+            seed = int(np.random.SeedSequence().generate_state(1, dtype=np.uint64)[0])
+            logging.warning("random_stream TAG without a seed: draws are not shared with other runs")
+
+        self.policy.prepare(self)
+        self.sink.open()
+
+        offset = 0
+        for chunk in chunks:
+            self.sink.add_chunk(chunk, offset)
+
+            processing_times, exit_delays = sample_service_times(chunk, inp.registry, seed, inp.random_stream, inp.antithetic, rng)
+            processing_times = processing_times.tolist()
+            exit_delays = exit_delays.tolist()
+            populations = [POPULATIONS[code] for code in chunk.population.tolist()]
+
+            for i, now in enumerate(chunk.times.tolist()):
+                tag = offset + i
+                if step > 0 and (tag+1) % step == 0:
+                    logging.info(f"Processing tag {tag+1}/{total}" if total is not None else f"Processing tag {tag+1}")
+
+                self._process_events_until(now)
+                self._arrive(tag, now, populations[i], processing_times[i], exit_delays[i])
+                self._dispatch(now)
+
+            offset += len(chunk)
+            # tags older than every queue head will not be referenced by any record anymore
+            self.sink.release(min([queue[0] for queue in self.queues.values() if queue], default=offset))
+
+        self._process_events_until(None)
+
+        return self.sink.close()
+
+    def _push(self, time: int, kind: int, payload):
+        heapq.heappush(self._events, (time, kind, self._sequence, payload))
+        self._sequence += 1
+
+    def _process_events_until(self, limit: int | None):
+        events = self._events
+        while events and (limit is None or events[0][0] <= limit):
+            time, kind, _, payload = heapq.heappop(events)
+
+            if kind == EXIT_COMPLETE:
+                self.exit_counts[payload] -= 1
+                continue
+
+            # SERVER_FREE: the tag moves into the exit queue, the server looks for a new tag
+            population, queue_exit_time = payload
+            if queue_exit_time > time:
+                self.exit_counts[population] += 1
+                self._push(queue_exit_time, EXIT_COMPLETE, population)
+
+            if self._waiting > 0:
+                self._dispatch(time)
+
+    def _arrive(self, tag: int, now: int, population: PopulationType, processing_time: int, exit_delay: int):
+        if self.queue_sizes is not None:
+            if len(self.queues[population]) >= self.queue_sizes[population]:
+                self.sink.reject(tag, now, "entry_queue_full")
+                return
+
+            if self.exit_counts[population] >= self.queue_sizes[population]:
+                self.sink.reject(tag, now, "exit_queue_full")
+                return
+
+        self.times[tag] = now
+        self.processing_times[tag] = processing_time
+        self.exit_delays[tag] = exit_delay
+        self.queues[population].append(tag)
+        self._waiting += 1
+
+    def _dispatch(self, now: int):
+        while self._waiting > 0 and self.servers.earliest_free() <= now:
+            population = self.policy.select(now, self.queues)
+            if population is None:
+                return
+
+            tag = self.queues[population].popleft()
+            self._waiting -= 1
+
+            server, server_arrival_time = self.servers.acquire(now)
+
+            server_exit_time = server_arrival_time + self.processing_times.pop(tag)
+
+            if self.policy.exit_queue:
+                queue_exit_time = server_exit_time + self.exit_delays.pop(tag)
+            else:
+                queue_exit_time = server_exit_time
+                del self.exit_delays[tag]
+
+            self.servers.release(server, server_arrival_time, server_exit_time)
+            self._push(server_exit_time, SERVER_FREE, (population, queue_exit_time))
+            self.policy.on_dispatch(now, population, tag)
+
+            self.sink.accept(tag, self.times.pop(tag), server_arrival_time, server_exit_time, queue_exit_time)
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+
+def waiting_time_seconds(df: pd.DataFrame) -> np.ndarray:
+    waits = df["server_arrival_time"].to_numpy().astype("datetime64[ns]") - df["queue_arrival_time"].to_numpy().astype("datetime64[ns]")
+    return (waits.view(np.int64) / 1e9).astype(np.float32)
+
+def _percentile_key(q: float) -> str:
+    return f"P{q * 100:g}"
+
+class GroupedMetrics:
+    """
+    Waiting time aggregates of a result DataFrame, shared by stats.json and the waiting time plot.
+    The waiting time is computed once (float32 seconds) and every aggregate is a single
+    cythonised groupby over it, per population or per (time bucket, population).
+    """
+
+    def __init__(self, df: pd.DataFrame, freq: str = "10min"):
+        self.frame = pd.DataFrame({
+            "population": df["population"].to_numpy(),
+            "time": df["queue_arrival_time"].dt.floor(freq).to_numpy(),
+            "waiting_time": waiting_time_seconds(df),
+        })
+
+    def population_waiting_stats(self, percentiles: list[float] = [0.5, 0.9]) -> pd.DataFrame:
+        # one row per population in order of appearance: count, mean, max and P.. columns, in seconds
+        grouped = self.frame.groupby("population", sort=False)["waiting_time"]
+        stats = grouped.agg(["count", "mean", "max"])
+
+        if percentiles and not self.frame.empty:
+            quantiles = grouped.quantile(percentiles).unstack()
+            quantiles.columns = [_percentile_key(q) for q in quantiles.columns]
+            stats = stats.join(quantiles)
+        return stats
+
+    def waiting_time_stats(self, p: float = 0.9) -> pd.DataFrame:
+        # median and p quantile per (time, population), in minutes, as plot_waiting_time_by_population_type expects
+        if self.frame.empty:
+            return pd.DataFrame(columns=["time", "population", "median", "p90"])
+
+        quantiles = self.frame.groupby(["time", "population"])["waiting_time"].quantile([0.5, p]).unstack() / 60
+        return pd.DataFrame({
+            "time": quantiles.index.get_level_values("time"),
+            "population": quantiles.index.get_level_values("population"),
+            "median": quantiles[0.5].to_numpy(dtype=float),
+            "p90": quantiles[p].to_numpy(dtype=float),
+        })
+
+    def population_stats(self, rejected_df: pd.DataFrame, occupancy_df: pd.DataFrame, percentiles: list[float] = [0.5, 0.9]) -> dict:
+        # stats.json content, waiting times in minutes
+        waiting = self.population_waiting_stats(percentiles)
+
+        rejected = rejected_df.loc[rejected_df["reason"] == "entry_queue_full", "population"].value_counts() if not rejected_df.empty else None
+        occupancy = occupancy_df.groupby("population")["queue_occupancy"].mean() if not occupancy_df.empty else pd.Series(dtype=float)
+
+        summary = {}
+        for pop, row in waiting.iterrows():
+            total = int(row["count"])
+            if rejected is None:
+                percent_rejected = "-"  # met un "-" si le DataFrame est vide
+            else:
+                percent_rejected = 100 * int(rejected.get(pop, 0)) / total
+
+            summary[pop] = {
+                'total_arrivals': total,
+                'percent_rejected': percent_rejected,
+                'waiting_time': {
+                    'mean': float(row["mean"]) / 60,
+                    'max': float(row["max"]) / 60,
+                    **{_percentile_key(q): float(row[_percentile_key(q)]) / 60 for q in percentiles}
+                },
+                'avg_queue_occupancy': float(occupancy.get(pop, 0))
+            }
+        return summary
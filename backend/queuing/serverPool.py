@@ -0,0 +1,72 @@
+import heapq
+
+import pandas as pd
+
+from common.utils import NS_PER_SECOND, TIME_MIN_NS
+
+class ServerPool:
+    """
+    K servers kept in a heap keyed by the instant they become free, so a tag always
+    goes to the server that frees up first (ties go to the lowest server index).
+    Each server also records its job count, busy time and the idle gaps between its jobs.
+    """
+
+    def __init__(self, size: int):
+        if size < 1:
+            raise ValueError("A server pool needs at least one server.")
+
+        self.size = size
+        self._heap = [(TIME_MIN_NS, server) for server in range(size)]
+
+        self.jobs = [0] * size
+        self.busy_time = [0] * size
+        self.idle_time = [0] * size
+        self.idle_gaps = [0] * size
+        self.max_idle_gap = [0] * size
+        self.first_start = [None] * size
+        self.last_end = [None] * size
+
+    def earliest_free(self) -> int:
+        return self._heap[0][0]
+
+    def acquire(self, arrival_time: int) -> tuple[int, int]:
+        # returns (server, start) where start is when the server can actually take the job
+        free_time, server = heapq.heappop(self._heap)
+        start = max(arrival_time, free_time)
+
+        if self.last_end[server] is None:
+            self.first_start[server] = start
+        elif start > free_time:
+            gap = start - free_time
+            self.idle_time[server] += gap
+            self.idle_gaps[server] += 1
+            self.max_idle_gap[server] = max(self.max_idle_gap[server], gap)
+
+        return server, start
+
+    def release(self, server: int, start: int, end: int):
+        self.jobs[server] += 1
+        self.busy_time[server] += end - start
+        self.last_end[server] = end
+        heapq.heappush(self._heap, (end, server))
+
+    def dispatch(self, arrival_time: int, duration: int) -> tuple[int, int, int]:
+        server, start = self.acquire(arrival_time)
+        end = start + duration
+        self.release(server, start, end)
+        return server, start, end
+
+    def stats_dataframe(self) -> pd.DataFrame:
+        starts = [t for t in self.first_start if t is not None]
+        ends = [t for t in self.last_end if t is not None]
+        span = max(ends) - min(starts) if starts else 0
+
+        return pd.DataFrame({
+            "server": range(self.size),
+            "jobs": self.jobs,
+            "busy_time_s": [t / NS_PER_SECOND for t in self.busy_time],
+            "idle_time_s": [t / NS_PER_SECOND for t in self.idle_time],
+            "idle_gaps": self.idle_gaps,
+            "max_idle_gap_s": [t / NS_PER_SECOND for t in self.max_idle_gap],
+            "utilisation": [t / span if span > 0 else 0.0 for t in self.busy_time],
+        })
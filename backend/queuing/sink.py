@@ -0,0 +1,294 @@
+import json
+import os
+from bisect import bisect_right
+from abc import ABC, abstractmethod
+from uuid import UUID
+
+import numpy as np
+import pandas as pd
+
+from common.model import TagBatch
+from common.utils import NS_PER_SECOND
+from queuing.accumulators import MetricsAccumulator
+from queuing.tools import *
+
+NS_PER_DAY = 24 * 3600 * NS_PER_SECOND
+
+ACCEPTED_COLUMNS = ["queue_arrival_time", "server_arrival_time", "server_exit_time", "queue_exit_time"]
+FRAME_COLUMNS = {
+    "accepted": ["tag_id", "population", "exercise_name", *ACCEPTED_COLUMNS],
+    "rejected": ["tag_id", "population", "exercise_name", "queue_arrival_time", "reason"],
+}
+
+class ResultSink(ABC):
+    """
+    Receives the simulation records as the kernel produces them.
+    accept() is called in dispatch order (non-decreasing server_arrival_time) and reject()
+    in arrival order, every time being int64 ns.
+
+    Tags are numbered in arrival order. The kernel hands the tag chunks over with add_chunk()
+    and calls release() once no record will refer to tags below some number anymore, chunks
+    are then dropped unless the sink still needs them (_oldest_needed).
+    """
+
+    def open(self):
+        self._offsets = []
+        self._chunks = []
+
+    def add_chunk(self, batch: TagBatch, offset: int):
+        self._offsets.append(offset)
+        self._chunks.append(batch)
+
+    def release(self, before: int):
+        keep = min(before, self._oldest_needed())
+        while len(self._chunks) > 1 and self._offsets[0] + len(self._chunks[0]) <= keep:
+            self._offsets.pop(0)
+            self._chunks.pop(0)
+
+    def _oldest_needed(self) -> int:
+        # smallest tag number the sink still has to resolve later
+        return np.iinfo(np.int64).max
+
+    def _locate(self, tag: int) -> tuple[TagBatch, int]:
+        chunk = bisect_right(self._offsets, tag) - 1
+        return self._chunks[chunk], tag - self._offsets[chunk]
+
+    def tags(self, indices) -> TagBatch:
+        # the tags numbered indices, in that order
+        indices = np.asarray(indices, dtype=np.int64)
+        if len(self._chunks) == 1:
+            return self._chunks[0].take(indices - self._offsets[0])
+
+        chunk_of = np.searchsorted(self._offsets, indices, side="right") - 1
+        order = np.argsort(chunk_of, kind="stable")
+        parts = [
+            self._chunks[chunk].take(indices[order][chunk_of[order] == chunk] - self._offsets[chunk])
+            for chunk in np.unique(chunk_of)
+        ]
+        batch = TagBatch.concat(parts) if parts else TagBatch.empty()
+        return batch.take(np.argsort(order)) if parts else batch
+
+    @abstractmethod
+    def accept(self, tag: int, queue_arrival_time: int, server_arrival_time: int, server_exit_time: int, queue_exit_time: int):
+        pass
+
+    @abstractmethod
+    def reject(self, tag: int, queue_arrival_time: int, reason: str):
+        pass
+
+    @abstractmethod
+    def close(self):
+        pass
+
+class DataFrameSink(ResultSink):
+    # keeps everything in memory and returns (df, rejected_df), convenient for small runs
+    def open(self):
+        super().open()
+        self.accepted = []
+        self.queue_arrival_times = []
+        self.server_arrival_times = []
+        self.server_exit_times = []
+        self.queue_exit_times = []
+        self.rejected = []
+        self.rejected_reasons = []
+
+    def accept(self, tag, queue_arrival_time, server_arrival_time, server_exit_time, queue_exit_time):
+        self.accepted.append(tag)
+        self.queue_arrival_times.append(queue_arrival_time)
+        self.server_arrival_times.append(server_arrival_time)
+        self.server_exit_times.append(server_exit_time)
+        self.queue_exit_times.append(queue_exit_time)
+
+    def reject(self, tag, queue_arrival_time, reason):
+        self.rejected.append(tag)
+        self.rejected_reasons.append(reason)
+
+    def _oldest_needed(self) -> int:
+        return 0
+
+    def close(self) -> tuple[pd.DataFrame, pd.DataFrame]:
+        # chunks are numbered contiguously, so their concatenation is indexed by tag number
+        batch = self._chunks[0] if len(self._chunks) == 1 else TagBatch.concat(self._chunks)
+        df = create_result_dataframe(batch, self.accepted, self.queue_arrival_times, self.server_arrival_times, self.server_exit_times, self.queue_exit_times)
+        return df, create_rejected_dataframe(batch, self.rejected, self.rejected_reasons)
+
+class MetricsSink(ResultSink):
+    # only keeps the aggregates of a MetricsAccumulator, close() returns the accumulator
+    def __init__(self, accumulator: MetricsAccumulator | None = None):
+        self.accumulator = accumulator if accumulator is not None else MetricsAccumulator()
+
+    def open(self):
+        super().open()
+        self._labels = {}
+
+    def add_chunk(self, batch: TagBatch, offset: int):
+        super().add_chunk(batch, offset)
+        self._labels[offset] = get_population_labels(batch.population, batch.strength)
+
+    def release(self, before: int):
+        super().release(before)
+        self._labels = {offset: self._labels[offset] for offset in self._offsets}
+
+    def _label(self, tag: int) -> str:
+        offset = self._offsets[bisect_right(self._offsets, tag) - 1]
+        return self._labels[offset][tag - offset]
+
+    def accept(self, tag, queue_arrival_time, server_arrival_time, server_exit_time, queue_exit_time):
+        self.accumulator.accept(self._label(tag), queue_arrival_time, server_arrival_time)
+
+    def reject(self, tag, queue_arrival_time, reason):
+        self.accumulator.reject(self._label(tag), queue_arrival_time, reason)
+
+    def close(self) -> MetricsAccumulator:
+        return self.accumulator
+
+class TeeSink(ResultSink):
+    # forwards every record to several sinks, close() returns their results as a list
+    def __init__(self, *sinks: ResultSink):
+        self.sinks = sinks
+
+    def open(self):
+        super().open()
+        for sink in self.sinks:
+            sink.open()
+
+    def add_chunk(self, batch: TagBatch, offset: int):
+        for sink in self.sinks:
+            sink.add_chunk(batch, offset)
+
+    def release(self, before: int):
+        for sink in self.sinks:
+            sink.release(before)
+
+    def accept(self, tag, queue_arrival_time, server_arrival_time, server_exit_time, queue_exit_time):
+        for sink in self.sinks:
+            sink.accept(tag, queue_arrival_time, server_arrival_time, server_exit_time, queue_exit_time)
+
+    def reject(self, tag, queue_arrival_time, reason):
+        for sink in self.sinks:
+            sink.reject(tag, queue_arrival_time, reason)
+
+    def close(self) -> list:
+        return [sink.close() for sink in self.sinks]
+
+class PartitionedSink(ResultSink):
+    """
+    Writes records as columnar .npz partitions, one folder per simulated day:
+    directory/accepted/<day>/part-00000.npz and directory/rejected/<day>/part-00000.npz.
+    A partition is flushed as soon as the simulation moves to the next day or chunk_size
+    records are buffered, so memory stays bounded whatever the horizon.
+    Use read_partitions() to get DataFrames back.
+    """
+
+    def __init__(self, directory: str, chunk_size: int = 1_000_000):
+        self.directory = directory
+        self.chunk_size = chunk_size
+
+    def open(self):
+        super().open()
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._exercise_codes = {}
+        self._population_codes = {label: code for code, label in enumerate(get_population_types())}
+        self._accepted = [[] for _ in range(1 + len(ACCEPTED_COLUMNS))]
+        self._rejected = [[], [], []]
+        self._accepted_day = None
+        self._rejected_day = None
+        self._parts = {}
+
+    def accept(self, tag, queue_arrival_time, server_arrival_time, server_exit_time, queue_exit_time):
+        day = server_arrival_time // NS_PER_DAY
+        if day != self._accepted_day or len(self._accepted[0]) >= self.chunk_size:
+            self._flush_accepted()
+            self._accepted_day = day
+
+        for column, value in zip(self._accepted, (tag, queue_arrival_time, server_arrival_time, server_exit_time, queue_exit_time)):
+            column.append(value)
+
+    def reject(self, tag, queue_arrival_time, reason):
+        day = queue_arrival_time // NS_PER_DAY
+        if day != self._rejected_day or len(self._rejected[0]) >= self.chunk_size:
+            self._flush_rejected()
+            self._rejected_day = day
+
+        for column, value in zip(self._rejected, (tag, queue_arrival_time, reason)):
+            column.append(value)
+
+    def close(self) -> str:
+        self._flush_accepted()
+        self._flush_rejected()
+        # written last, read_partitions needs it to decode the partitions
+        with open(os.path.join(self.directory, "meta.json"), "w") as f:
+            json.dump({"exercise_names": list(self._exercise_codes), "populations": get_population_types()}, f)
+        return self.directory
+
+    def _oldest_needed(self) -> int:
+        buffered = self._accepted[0] + self._rejected[0]
+        return min(buffered) if buffered else super()._oldest_needed()
+
+    def _tag_columns(self, tags: np.ndarray) -> dict:
+        batch = self.tags(tags)
+        labels = get_population_labels(batch.population, batch.strength)
+        exercise_map = np.array([self._exercise_codes.setdefault(name, len(self._exercise_codes)) for name in batch.exercise_names], dtype=np.int32)
+        return {
+            "tag_id": batch.ids,
+            "population": np.array([self._population_codes[label] for label in labels], dtype=np.int8),
+            "exercise": exercise_map[batch.exercise] if len(batch) else batch.exercise,
+        }
+
+    def _write(self, kind: str, day: int, columns: dict):
+        folder = os.path.join(self.directory, kind, str(np.datetime64(day, "D")))
+        os.makedirs(folder, exist_ok=True)
+        part = self._parts.get((kind, day), 0)
+        self._parts[(kind, day)] = part + 1
+        np.savez(os.path.join(folder, f"part-{part:05d}.npz"), **columns)
+
+    def _flush_accepted(self):
+        if not self._accepted[0]:
+            return
+        tags = np.array(self._accepted[0], dtype=np.int64)
+        columns = self._tag_columns(tags)
+        for name, values in zip(ACCEPTED_COLUMNS, self._accepted[1:]):
+            columns[name] = np.array(values, dtype=np.int64)
+        self._write("accepted", self._accepted_day, columns)
+        self._accepted = [[] for _ in self._accepted]
+
+    def _flush_rejected(self):
+        if not self._rejected[0]:
+            return
+        tags = np.array(self._rejected[0], dtype=np.int64)
+        columns = self._tag_columns(tags)
+        columns["queue_arrival_time"] = np.array(self._rejected[1], dtype=np.int64)
+        columns["reason"] = np.array(self._rejected[2])
+        self._write("rejected", self._rejected_day, columns)
+        self._rejected = [[], [], []]
+
+def _read_partition_frame(directory: str, kind: str, meta: dict, days: list[str] | None) -> pd.DataFrame:
+    root = os.path.join(directory, kind)
+    days_found = sorted(os.listdir(root)) if os.path.isdir(root) else []
+
+    parts = []
+    for day in days_found:
+        if days is not None and day not in days:
+            continue
+        for name in sorted(os.listdir(os.path.join(root, day))):
+            with np.load(os.path.join(root, day, name)) as part:
+                parts.append({key: part[key] for key in part.files})
+    if not parts:
+        return pd.DataFrame(columns=FRAME_COLUMNS[kind])
+
+    columns = {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+    frame = {
+        "tag_id": [UUID(bytes=raw.tobytes()) for raw in columns.pop("tag_id")],
+        "population": np.array(meta["populations"], dtype=object)[columns.pop("population")],
+        "exercise_name": np.array(meta["exercise_names"], dtype=object)[columns.pop("exercise")],
+    }
+    for name, values in columns.items():
+        frame[name] = values if name == "reason" else ns_to_datetime64(values)
+    return pd.DataFrame(frame)
+
+def read_partitions(directory: str, days: list[str] | None = None) -> tuple[pd.DataFrame, pd.DataFrame]:
+    # (df, rejected_df) as process() would return them, optionally limited to some "YYYY-MM-DD" days
+    with open(os.path.join(directory, "meta.json")) as f:
+        meta = json.load(f)
+    return _read_partition_frame(directory, "accepted", meta, days), _read_partition_frame(directory, "rejected", meta, days)
@@ -1,11 +1,13 @@
 from typing import List
 import pandas as pd
 from datetime import timedelta
-from common.model import PopulationType
+from common.model import PopulationType, POPULATION_CODES, TagBatch
 from functools import reduce
 import operator
 import numpy as np
 
+from queuing.metrics import GroupedMetrics
+
 def get_population(population: PopulationType, is_strong: bool) -> str:
     if population == PopulationType.PREPA:
         return "prepa"
@@ -14,69 +16,115 @@ def get_population(population: PopulationType, is_strong: bool) -> str:
 
     return "ing_" + strong
 
+def get_population_labels(population: np.ndarray, strength: np.ndarray) -> np.ndarray:
+    labels = np.where(strength == 1, "ing_strong", "ing_mean").astype(object)
+    labels[population == POPULATION_CODES[PopulationType.PREPA]] = "prepa"
+    return labels
+
 def get_population_types():
     return ["prepa", "ing_strong", "ing_mean"]
 
-def create_occupancy_by_population_dataframe(df: pd.DataFrame, start_column : str = "queue_arrival_time", end_column : str = "server_arrival_time") -> pd.DataFrame:
+def ns_to_datetime64(times) -> np.ndarray:
+    return np.asarray(times, dtype=np.int64).astype("datetime64[ns]")
+
+def create_result_dataframe(
+    batch: TagBatch,
+    indices: list[int],
+    queue_arrival_times: list,
+    server_arrival_times: list,
+    server_exit_times: list,
+    queue_exit_times: list
+) -> pd.DataFrame:
+    # times come from the engines as int64 nanoseconds, they only become datetime64 here
+    indices = np.asarray(indices, dtype=np.int64)
+
+    return pd.DataFrame({
+        "tag_id": batch.tag_ids(indices),
+        "population": get_population_labels(batch.population[indices], batch.strength[indices]),
+        "exercise_name": np.array(batch.exercise_names, dtype=object)[batch.exercise[indices]],
+        "queue_arrival_time": ns_to_datetime64(queue_arrival_times),
+        "server_arrival_time": ns_to_datetime64(server_arrival_times),
+        "server_exit_time": ns_to_datetime64(server_exit_times),
+        "queue_exit_time": ns_to_datetime64(queue_exit_times)
+    })
+
+def create_rejected_dataframe(batch: TagBatch, indices: list[int], reasons: list[str]) -> pd.DataFrame:
+    indices = np.asarray(indices, dtype=np.int64)
+
+    return pd.DataFrame({
+        "tag_id": batch.tag_ids(indices),
+        "population": get_population_labels(batch.population[indices], batch.strength[indices]),
+        "exercise_name": np.array(batch.exercise_names, dtype=object)[batch.exercise[indices]],
+        "queue_arrival_time": batch.datetimes()[indices],
+        "reason": reasons
+    })
+
+def _time_values(column: pd.Series) -> np.ndarray:
+    return column.to_numpy().astype("datetime64[ns]").view(np.int64)
+
+def create_occupancy_by_population_dataframe(
+    df: pd.DataFrame,
+    start_column : str = "queue_arrival_time",
+    end_column : str = "server_arrival_time",
+    resolution : str | timedelta = "10min"
+) -> pd.DataFrame:
+    """
+    Queue occupancy (tags with start <= t < end) sampled every resolution from the first start
+    to the last end, for every population, plus the exact peak reached inside each bucket
+    [t, t + resolution).
+
+    Events are encoded as population << 56 | (time - first start) so that a single sort and
+    cumsum give every population's step function at once, and the samples are read back with
+    searchsorted. Relative times must fit in 56 bits (about 830 days).
+    """
     if df.empty:
-        return pd.DataFrame(columns=["time", "population", "queue_occupancy"])
-    
-    start_time = df[start_column].min()
-    end_time = df[end_column].max()
+        return pd.DataFrame(columns=["time", "population", "queue_occupancy", "peak_occupancy"])
 
-    print(f"Calculating occupancy from {start_time} to {end_time}")
+    step = pd.Timedelta(resolution).value
+    if step <= 0:
+        raise ValueError("The occupancy resolution must be positive.")
 
-    time_range = pd.date_range(start=start_time, end=end_time, freq='10T')
-    
-    occupancy_results = []
     population_types = get_population_types()
-    
-    for pop_type in population_types:
-        pop_df = df[df['population'] == pop_type].copy()
-        
-        if pop_df.empty:
-            for t in time_range:
-                occupancy_results.append({
-                    "time": t,
-                    "population": pop_type,
-                    "queue_occupancy": 0
-                })
-            continue
-        
-        starts = pop_df[[start_column]].copy()
-        starts['delta'] = 1
-        starts = starts.rename(columns={start_column: 'event_time'})
-        
-        ends = pop_df[[end_column]].copy()
-        ends['delta'] = -1
-        ends = ends.rename(columns={end_column: 'event_time'})
-        
-        events = pd.concat([starts, ends], ignore_index=True)
-        events = events.sort_values('event_time')
-        
-        events['occupancy'] = events['delta'].cumsum()
-        
-        # Using merge_asof for efficient lookup
-        query_df = pd.DataFrame({'time': time_range})
-        result = pd.merge_asof(
-            query_df,
-            events[['event_time', 'occupancy']],
-            left_on='time',
-            right_on='event_time',
-            direction='backward'
-        )
-        
-        result['occupancy'] = result['occupancy'].fillna(0).astype(int)
-        result['population'] = pop_type
-        
-        for _, row in result.iterrows():
-            occupancy_results.append({
-                "time": row['time'],
-                "population": pop_type,
-                "queue_occupancy": row['occupancy']
-            })
-    
-    return pd.DataFrame(occupancy_results)
+    codes = pd.Categorical(df["population"], categories=population_types).codes.astype(np.int64)
+    starts = _time_values(df[start_column])
+    ends = _time_values(df[end_column])
+
+    start_time = starts.min()
+    end_time = ends.max()
+
+    print(f"Calculating occupancy from {pd.Timestamp(start_time)} to {pd.Timestamp(end_time)}")
+
+    n_samples = (end_time - start_time) // step + 1
+    offset = codes << 56
+    start_keys = np.sort(offset + (starts - start_time))
+    end_keys = np.sort(offset + (ends - start_time))
+
+    sample_times = np.arange(n_samples, dtype=np.int64) * step
+    sample_keys = (np.arange(len(population_types), dtype=np.int64)[:, None] << 56) + sample_times
+    occupancy = (
+        np.searchsorted(start_keys, sample_keys, side="right")
+        - np.searchsorted(end_keys, sample_keys, side="right")
+    )
+
+    # level right after every event, ends first on ties so that the level never
+    # goes above the real one; each population sums to zero so one cumsum is enough
+    event_keys = np.concatenate([end_keys, start_keys])
+    deltas = np.concatenate([np.full(len(end_keys), -1), np.ones(len(start_keys), dtype=np.int64)])
+    order = np.lexsort((deltas, event_keys))
+    event_keys = event_keys[order]
+    levels = np.cumsum(deltas[order])
+
+    buckets = (event_keys >> 56) * n_samples + (event_keys & ((1 << 56) - 1)) // step
+    first = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    peak = occupancy.ravel().copy()
+    peak[buckets[first]] = np.maximum(peak[buckets[first]], np.maximum.reduceat(levels, first))
+
+    return pd.DataFrame({
+        "time": ns_to_datetime64(np.tile(sample_times + start_time, len(population_types))),
+        "population": np.repeat(population_types, n_samples),
+        "queue_occupancy": occupancy.ravel(),
+        "peak_occupancy": peak
+    })
 
 def create_rejected_tags_dataframe(rejected_df: pd.DataFrame, reason : str = "entry_queue_full") -> pd.DataFrame:
     if rejected_df.empty:
@@ -118,28 +166,66 @@ def get_queue_occupancy_at_time(
 
     return final_mask.sum(), final_mask
 
+class OccupancyIndex:
+    """
+    Answers "how many tags are in the queue at t" (start <= t < end) for whole vectors of query
+    times in O(m log n), instead of one full mask per query like get_queue_occupancy_at_time.
+
+    Start and end times are sorted once per group of the `by` columns, a query only runs
+    searchsorted on the groups selected by its filter (same format as get_queue_occupancy_at_time).
+    """
+
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        start_column: str = "queue_arrival_time",
+        end_column: str = "server_arrival_time",
+        by: tuple[str, ...] = ("population", "exercise_name")
+    ):
+        self.by = tuple(by)
+        starts = _time_values(df[start_column])
+        ends = _time_values(df[end_column])
+
+        self.groups = {}
+        if not df.empty:
+            for key, positions in df.groupby(list(self.by), sort=False).indices.items():
+                key = key if isinstance(key, tuple) else (key,)
+                self.groups[key] = (np.sort(starts[positions]), np.sort(ends[positions]))
+
+        self.all = (np.sort(starts), np.sort(ends))
+
+    def _selected(self, filter: dict[str, str | list[str]] | None) -> list[tuple[np.ndarray, np.ndarray]]:
+        if not filter:
+            return [self.all]
+
+        unknown = set(filter) - set(self.by)
+        if unknown:
+            raise ValueError(f"OccupancyIndex can only filter on {self.by}, not {sorted(unknown)}.")
+
+        allowed = [
+            None if column not in filter else set(filter[column]) if isinstance(filter[column], list) else {filter[column]}
+            for column in self.by
+        ]
+        return [
+            endpoints for key, endpoints in self.groups.items()
+            if all(values is None or value in values for value, values in zip(key, allowed))
+        ]
+
+    def count(self, query_times, filter: dict[str, str | list[str]] | None = None) -> np.ndarray:
+        # query_times: datetimes or int64 ns, scalar or array-like
+        query_times = np.atleast_1d(np.asarray(query_times))
+        if not np.issubdtype(query_times.dtype, np.integer):
+            # exact for Timestamp objects too, astype("datetime64[ns]") would go through microseconds
+            query_times = pd.to_datetime(query_times).asi8
+
+        counts = np.zeros(len(query_times), dtype=np.int64)
+        for starts, ends in self._selected(filter):
+            counts += np.searchsorted(starts, query_times, side="right") - np.searchsorted(ends, query_times, side="right")
+        return counts
+
 def create_waiting_time_stats_dataframe(
     df: pd.DataFrame,
-    freq: str = "10T",
+    freq: str = "10min",
     p: float = 0.9
 ) -> pd.DataFrame:
-    df = df.copy()
-
-    df['waiting_time_min'] = (
-        df['server_arrival_time'] - df['queue_arrival_time']
-    ).dt.total_seconds() / 60
-
-    df['time'] = df['queue_arrival_time'].dt.floor(freq)
-
-    stats_df = (
-        df
-        .groupby(['time', 'population'])
-        ['waiting_time_min']
-        .agg(
-            median='median',
-            p90=lambda x: x.quantile(p)
-        )
-        .reset_index()
-    )
-
-    return stats_df
+    return GroupedMetrics(df, freq).waiting_time_stats(p)
@@ -1,14 +1,24 @@
-from datetime import timedelta
 from queuing.hierarchy import *
+from queuing.kernel import DispatchPolicy
 from common.model import *
-from common.utils import *
-from queuing.tools import *
-from pandas import DataFrame
-
 from collections import deque
 
-import random
-import time
+class WaterfallPolicy(DispatchPolicy):
+    # in waterfall, only one entry queue, K server, one exit queue
+    # queues are infinite, so no rejections, and tags leave as soon as they are processed
+    finite_queues = False
+    exit_queue = False
+
+    def prepare(self, kernel):
+        self.times = kernel.times
+
+    def select(self, now: int, queues: dict[PopulationType, deque]) -> PopulationType | None:
+        # a single FIFO queue: serve the population whose head arrived first
+        selected = None
+        for population, queue in queues.items():
+            if len(queue) > 0 and (selected is None or self.times[queue[0]] < self.times[queues[selected][0]]):
+                selected = population
+        return selected
 
 class WaterfallQueueSystem(QueueSystem):
     @property
@@ -23,43 +33,5 @@ class WaterfallQueueSystem(QueueSystem):
     def architecture_type(self) -> ArchitectureType:
         return ArchitectureType.WATERFALL
 
-    def process(self, inp : Input) -> tuple[DataFrame, DataFrame]:
-        # in waterfall, only one entry queue, K server, one exit queue
-        # queues are infinite, so no rejections
-
-        K = inp.num_servers
-        servers = deque([datetime.min for _ in range(K)])
-
-        sorted_tags = sorted(inp.tags, key=lambda tag: tag.time)
-        df_list = []
-
-        for i, tag in enumerate(sorted_tags):
-            step = len(sorted_tags) // 10
-
-            if step > 0 and i % step == 0:
-                print(f"Processing tag {i}/{len(inp.tags)}")
-
-            queue_arrival_time = tag.time
-
-            server_available_time = servers.popleft()
-            server_arrival_time = max(queue_arrival_time, server_available_time)
-
-            pmin, pmax = inp.registry.exercises[tag.exercise_name]
-            processing_time = random_server_setup_delta() + timedelta(milliseconds=random.randint(pmin, pmax))
-            server_exit_time = server_arrival_time + processing_time
-
-            queue_exit_time = server_exit_time
-
-            servers.append(server_exit_time)
-
-            df_list.append({
-                "tag_id": tag.id,
-                "population": get_population(tag.population, tag.is_strong),
-                "exercise_name": tag.exercise_name,
-                "queue_arrival_time": queue_arrival_time,
-                "server_arrival_time": server_arrival_time,
-                "server_exit_time": server_exit_time,
-                "queue_exit_time": queue_exit_time
-            })
-
-        return DataFrame(df_list), DataFrame()
+    def create_policy(self, inp : Input) -> DispatchPolicy:
+        return WaterfallPolicy()
@@ -0,0 +1,104 @@
+import math
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+from scipy import stats
+
+from common.model import *
+from queuing import QUEUE_SYSTEMS
+from queuing.sink import MetricsSink
+
+def replication_seeds(base_seed: int | None, replications: int) -> list[int]:
+    # independent child seeds, unlike base_seed + i they do not overlap between nearby base seeds
+    children = np.random.SeedSequence(base_seed).spawn(replications)
+    return [int(child.generate_state(1, dtype=np.uint64)[0]) for child in children]
+
+def replication_tasks(base_seed: int | None, replications: int, antithetic: bool = False) -> list[tuple[int, bool]]:
+    # (seed, antithetic) of every run, antithetic runs come in pairs sharing a seed, the second one using 1 - u
+    if not antithetic:
+        return [(seed, False) for seed in replication_seeds(base_seed, replications)]
+    if replications % 2 != 0:
+        raise ValueError(f"Antithetic replications come in pairs, got an odd count ({replications}).")
+    return [(seed, flip) for seed in replication_seeds(base_seed, replications // 2) for flip in (False, True)]
+
+def run_replication(inp: Input) -> dict:
+    # stats.json content built from streaming accumulators, the per-tag results are never materialised
+    queue_system = QUEUE_SYSTEMS.get(inp.architecture)
+    accumulator = queue_system.process_to(inp, MetricsSink())
+    return accumulator.population_stats()
+
+def _run_replication_task(scenario: Input, task: tuple[int, bool]) -> dict:
+    # scenario.tags is a TagSource, every worker resolves (memory-maps) the tags itself instead of unpickling them
+    seed, antithetic = task
+    return run_replication(scenario.model_copy(update={"seed": seed, "antithetic": antithetic}))
+
+def run_replications(
+    inp: Input,
+    replications: int = 10,
+    base_seed: int | None = None,
+    max_workers: int | None = None,
+    confidence: float = 0.95,
+    antithetic: bool = False
+) -> dict:
+    """
+    Runs `replications` independent seeds of inp's architecture in a process pool and merges
+    the compute_population_stats results into mean / confidence interval estimates.
+    With antithetic, runs go by pairs (u, 1 - u), replications must be even and the intervals are
+    computed over pair means.
+    """
+    tasks = replication_tasks(base_seed, replications, antithetic)
+
+    with tempfile.TemporaryDirectory(prefix="tags_") as archive:
+        # archives and cache entries are shipped as is, anything else is written once for the workers
+        source = inp.tags
+        if not isinstance(source, TagSource) or (source.archive is None and source.cache_key is None):
+            inp.tag_batch().save(archive)
+            source = TagSource(archive=archive)
+        scenario = inp.model_copy(update={"tags": source})
+
+        with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+            results = list(pool.map(_run_replication_task, repeat(scenario), tasks))
+
+    return merge_replications(results, confidence, antithetic)
+
+def merge_replications(results: list[dict], confidence: float = 0.95, antithetic: bool = False) -> dict:
+    if antithetic:
+        results = [mean_stats(results[i:i + 2]) for i in range(0, len(results), 2)]
+    return summarise_replications(results, confidence)
+
+def _map_leaves(results: list[dict], leaf: Callable[[list[float]], Any]):
+    # walks stats dicts of the same nesting together, every leaf becomes leaf(its finite numeric
+    # values over the results where it is defined), or "-" when there is none
+    first = next((result for result in results if result is not None), None)
+
+    if isinstance(first, dict):
+        keys = dict.fromkeys(key for result in results if isinstance(result, dict) for key in result)
+        return {key: _map_leaves([result.get(key) if isinstance(result, dict) else None for result in results], leaf) for key in keys}
+
+    values = [value for value in results if isinstance(value, (int, float)) and math.isfinite(value)]
+    return leaf(values) if values else "-"
+
+def mean_stats(results: list[dict]):
+    # leaf-wise mean of several stats dicts
+    return _map_leaves(results, lambda values: float(np.mean(values)))
+
+def confidence_interval(values: list[float], confidence: float = 0.95) -> dict:
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    mean = float(values.mean())
+
+    if n < 2:
+        return {"mean": mean, "std": None, "ci_low": None, "ci_high": None, "n": n}
+
+    std = float(values.std(ddof=1))
+    half_width = float(stats.t.ppf((1 + confidence) / 2, n - 1)) * std / math.sqrt(n)
+
+    return {"mean": mean, "std": std, "ci_low": mean - half_width, "ci_high": mean + half_width, "n": n}
+
+def summarise_replications(results: list[dict], confidence: float = 0.95):
+    # same nesting as stats.json, every numeric leaf becomes its mean / confidence interval
+    # over the replications where it is defined ("-" and None are skipped)
+    return _map_leaves(results, lambda values: confidence_interval(values, confidence))
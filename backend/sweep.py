@@ -0,0 +1,136 @@
+import hashlib
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any
+
+from pydantic import BaseModel
+
+from common.model import *
+from main import build_registry, build_calendar_config
+from pushs.generation import generate_pushes
+from replication import replication_tasks, run_replication, merge_replications
+
+GENERATION_SECTIONS = ("scrapper.", "ing.", "prepa.")
+
+class SweepSpec(BaseModel):
+    """
+    Declarative parameter sweep.
+
+    Every point is base updated with one combination of grid (cartesian product) and, when given,
+    one entry of points. Keys are Input fields (num_servers, architecture, time_limit...) or
+    generation parameters prefixed with their section ("ing.percentage_strong", "prepa.population_size").
+    A point may set "name" to choose its result folder, otherwise a hash of its parameters is used.
+    """
+    name: str
+    base: dict[str, Any] = {}
+    grid: dict[str, list[Any]] = {}
+    points: list[dict[str, Any]] = []
+    replications: int = 1
+    seed: Optional[int] = None
+    antithetic: bool = False
+
+def _key(params: dict) -> str:
+    return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+def expand_sweep(spec: SweepSpec) -> list[dict[str, Any]]:
+    grid_keys = list(spec.grid.keys())
+    combinations = [dict(zip(grid_keys, values)) for values in itertools.product(*spec.grid.values())]
+
+    points = []
+    for combination in combinations:
+        for point in spec.points or [{}]:
+            params = {**spec.base, **combination, **point}
+            params.setdefault("name", _key(params))
+            points.append(params)
+    return points
+
+def split_point(params: dict[str, Any]) -> tuple[dict[str, Any], dict[str, Any]]:
+    # (Input fields, generation overrides)
+    generation = {k: v for k, v in params.items() if k.startswith(GENERATION_SECTIONS)}
+    fields = {k: v for k, v in params.items() if k not in generation and k != "name"}
+    return fields, generation
+
+def _write_json(path: str, content):
+    # written under a temporary name then renamed, a point folder never holds a half-written file
+    with open(path + ".tmp", "w") as f:
+        json.dump(content, f, indent=4, default=str)
+    os.replace(path + ".tmp", path)
+
+def _run_point(point_dir: str, fields: dict[str, Any], archive: str, tasks: list[tuple[int, bool]], antithetic: bool):
+    fields = dict(fields)
+    fields.setdefault("registry", build_registry())
+    if fields.get("architecture") == ArchitectureType.CALENDAR_PRIORITY:
+        fields.setdefault("calendar_priority_config", build_calendar_config())
+
+    inp = Input(tags=TagSource(archive=archive), **fields)
+    _write_json(os.path.join(point_dir, "input.json"), inp.model_dump(mode="json"))
+    results = [run_replication(inp.model_copy(update={"seed": seed, "antithetic": flip})) for seed, flip in tasks]
+
+    if len(results) > 1:
+        _write_json(os.path.join(point_dir, "stats_ci.json"), merge_replications(results, antithetic=antithetic))
+    # stats.json is written last and marks the point as done
+    _write_json(os.path.join(point_dir, "stats.json"), results[0])
+    return point_dir
+
+def run_sweep(spec: SweepSpec, output_dir: str = "results", max_workers: int | None = None) -> list[str]:
+    """
+    Runs every point of the sweep in a process pool and stores each point in output_dir/<sweep name>/<point name>/
+    (point.json, input.json, stats.json and stats_ci.json when replicated). Tags are generated once per distinct set of
+    generation parameters and kept in output_dir/<sweep name>/tags/. Points that already have a stats.json
+    are skipped, so an interrupted sweep resumes where it stopped.
+    """
+    sweep_dir = os.path.join(output_dir, spec.name)
+    os.makedirs(sweep_dir, exist_ok=True)
+    _write_json(os.path.join(sweep_dir, "sweep.json"), spec.model_dump())
+
+    pending = {}
+    for params in expand_sweep(spec):
+        point_dir = os.path.join(sweep_dir, str(params["name"]))
+        if os.path.exists(os.path.join(point_dir, "stats.json")):
+            continue
+        os.makedirs(point_dir, exist_ok=True)
+        _write_json(os.path.join(point_dir, "point.json"), params)
+
+        fields, generation = split_point(params)
+        pending.setdefault(_key(generation), (generation, []))[1].append((point_dir, fields))
+
+    print(f"Sweep {spec.name}: {sum(len(points) for _, points in pending.values())} points to run")
+
+    # every point replays the same seeds, so with random_stream TAG the points also share their random numbers
+    tasks = replication_tasks(spec.seed, spec.replications, spec.antithetic)
+
+    done = []
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+        futures = []
+        for generation_key, (generation, points) in pending.items():
+            archive = os.path.join(sweep_dir, "tags", generation_key)
+            if not os.path.exists(os.path.join(archive, "meta.json")):
+                print(f"Generating tags for {generation or 'default parameters'}")
+                tags = generate_pushes(generation, plot=False)
+                tags = tags if isinstance(tags, TagBatch) else TagBatch.from_tags(tags)
+                tags.save(archive)
+
+            for point_dir, fields in points:
+                futures.append(pool.submit(_run_point, point_dir, fields, archive, tasks, spec.antithetic))
+
+        for future in as_completed(futures):
+            point_dir = future.result()
+            done.append(point_dir)
+            print(f"Finished {point_dir} ({len(done)}/{len(futures)})")
+
+    return done
+
+if __name__ == "__main__":
+    run_sweep(SweepSpec(
+        name="sweep",
+        base={
+            "population_queue_sizes": {PopulationType.ING: 3000, PopulationType.PREPA: 600},
+        },
+        grid={
+            "architecture": [ArchitectureType.WATERFALL, ArchitectureType.ANTI_PRIORITY, ArchitectureType.CHANNELS_AND_DAMS, ArchitectureType.CALENDAR_PRIORITY],
+            "num_servers": [200, 50],
+            "ing.percentage_strong": [0.1, 0.7],
+        },
+    ))